@@ -0,0 +1,40 @@
+"""Count SPI and GPIO traffic of the EPD driver through the recording backend.
+
+Run from the repository root:
+
+    python3 -m benchmarks.bench_driver
+"""
+import os
+import sys
+import timeit
+
+os.environ['EPD_BACKEND'] = 'recording'
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+
+from waveshare_epd import epd2in13_V4, epdconfig
+
+
+def measure(name, operation, number=200):
+    recorder = epdconfig.implementation
+    recorder.reset_stats()
+    operation()
+    stats = (recorder.spi_transactions, recorder.spi_bytes, recorder.gpio_writes)
+    seconds = timeit.timeit(operation, number=number) / number
+    print(f"{name:18s} {stats[0]:5d} spi  {stats[1]:5d} bytes  {stats[2]:5d} gpio  {seconds * 1e6:8.1f} us")
+
+
+def main():
+    epd = epd2in13_V4.EPD()
+    frame = bytes([0xFF]) * (epd.linewidth() * epd.height)
+    changed = bytearray(frame)
+    changed[epd.linewidth() * 40 + 3] = 0x0F
+    changed = bytes(changed)
+
+    measure('init', epd.init)
+    measure('init_fast', epd.init_fast)
+    measure('displayPartial', lambda: epd.displayPartial(changed))
+    measure('displayPartialWin', lambda: epd.displayPartialWindow(changed, frame))
+
+
+if __name__ == "__main__":
+    main()
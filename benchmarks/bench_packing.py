@@ -0,0 +1,64 @@
+"""Compare the legacy rotate/convert chain with single-pass frame packing.
+
+Run from the repository root:
+
+    python3 -m benchmarks.bench_packing
+"""
+import os
+import sys
+import timeit
+
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.framebuffer import pack_into, packed_size
+
+EPD_WIDTH = 122
+EPD_HEIGHT = 250
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts')
+
+
+def legacy_pack(image):
+    # update_display rotated 180 degrees, then EPD.getbuffer rotated 90
+    # degrees with expand, converted to '1' and copied into a bytearray
+    image = image.rotate(180)
+    image = image.rotate(90, expand=True).convert('1')
+    return bytearray(image.tobytes('raw'))
+
+
+def make_frame():
+    # Roughly the density of a real weather frame; Pillow's bit packing is
+    # branchy, so random noise would overstate the cost of every variant
+    image = Image.new('1', (EPD_HEIGHT, EPD_WIDTH), 255)
+    draw = ImageDraw.Draw(image)
+    bold = ImageFont.truetype(os.path.join(FONT_DIR, 'Montserrat-Bold.ttf'), 24)
+    regular = ImageFont.truetype(os.path.join(FONT_DIR, 'Montserrat-Regular.ttf'), 18)
+    icons = ImageFont.truetype(os.path.join(FONT_DIR, 'weathericons-regular-webfont.ttf'), 40)
+    draw.text((5, 5), '\uf00d', font=icons, fill=0)
+    draw.text((65, 10), '21.4°C / 70°F', font=bold, fill=0)
+    draw.text((65, 40), 'W: 12.3 km/h (7 mph) NE', font=regular, fill=0)
+    draw.line((0, 65, EPD_HEIGHT, 65), fill=0, width=2)
+    for i, text in enumerate(('Sat', 'Sun', 'Mon')):
+        draw.text((i * 83 + 20, 70), text, font=bold, fill=0)
+        draw.text((i * 83 + 15, 125 - 30), '22/13', font=bold, fill=0)
+    return image
+
+
+def main(number=2000):
+    image = make_frame()
+    out = bytearray(packed_size(EPD_WIDTH, EPD_HEIGHT))
+    assert pack_into(image, out) == legacy_pack(image)
+
+    results = {
+        'legacy': timeit.timeit(lambda: legacy_pack(image), number=number),
+        'single_pass': timeit.timeit(lambda: pack_into(image, out), number=number),
+    }
+    for name, total in results.items():
+        print(f"{name:12s} {total / number * 1e6:8.1f} us/frame")
+    print(f"speedup      {results['legacy'] / results['single_pass']:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
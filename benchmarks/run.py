@@ -0,0 +1,260 @@
+"""Benchmark suite for one display cycle: parsing, rendering, packing and SPI.
+
+Timings run on recorded Open-Meteo responses from benchmarks/fixtures, and
+the driver runs on the recording backend so SPI traffic can be counted
+without a panel. Results are flat metrics, written as JSON so runs on the
+same machine can be compared across commits.
+
+Run from the repository root:
+
+    python3 -m benchmarks.run --output before.json
+    python3 -m benchmarks.run --baseline before.json --threshold 0.2
+
+With --baseline the run fails (exit status 1) if a timing got slower by
+more than the threshold, or if a refresh sends more SPI transactions or
+bytes than before.
+"""
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import subprocess
+
+os.environ['EPD_BACKEND'] = 'recording'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'lib'))
+
+import PIL
+from PIL import Image, ImageDraw
+
+from waveshare_epd import epdconfig
+from src import playback
+from src.display_service import DisplayService
+from src.framebuffer import pack_into, packed_size
+from src.icons import IconDrawer
+from src.refresh_policy import RefreshPolicy
+from src.weather_service import WeatherService
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+RESULTS_VERSION = 1
+DEFAULT_THRESHOLD = 0.2
+
+# Metric name suffixes: timings are compared with the threshold, counters
+# are deterministic and must not grow at all
+TIME_SUFFIX = '_us'
+COUNT_SUFFIXES = ('_spi_transactions', '_spi_bytes')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def time_us(operation, number, repeat=5):
+    """Best time per call in microseconds; the minimum is the least noisy."""
+    return min(timeit.repeat(operation, number=number, repeat=repeat)) / number * 1e6
+
+
+def scaled(number, scale):
+    """Iteration count for a scale factor, at least one."""
+    return max(1, int(number * scale))
+
+
+def bench_parsing(metrics, scale):
+    raw = load_fixture('open_meteo_batch.json')
+    responses = json.loads(raw)
+    metrics['normalize_us'] = time_us(
+        lambda: [WeatherService.normalize(item) for item in responses], scaled(2000, scale)) / len(responses)
+    metrics['decode_batch_us'] = time_us(
+        lambda: [WeatherService.normalize(item) for item in json.loads(raw)], scaled(500, scale))
+
+    # Every playback step: the weather to show and whether it changed
+    weather = WeatherService.normalize(responses[0])
+    now = weather.current.time
+    shown = playback.view(weather, now)
+    metrics['view_us'] = time_us(lambda: playback.view(weather, now) != shown, scaled(2000, scale))
+
+
+def bench_icons(metrics, service, scale):
+    image = Image.new('1', (service.epd.height, service.epd.width), 255)
+    draw = ImageDraw.Draw(image)
+    codes = list(IconDrawer.WMO_TO_ICON)
+    drawers = {
+        'icon_atlas_us': IconDrawer(draw, service.icon_font_path, service.ICON_SIZE, service.icon_atlas),
+        'icon_font_us': IconDrawer(draw, service.icon_font_path, service.ICON_SIZE),
+    }
+    for name, drawer in drawers.items():
+        def draw_all():
+            for code in codes:
+                drawer.draw_icon_for_code(code, 0, 0, service.ICON_SIZE)
+        metrics[name] = time_us(draw_all, scaled(50, scale)) / len(codes)
+
+
+def bench_rendering(metrics, service, weather, scale):
+    names = ['Birmingham, AL', 'Calicut, Kerala', 'Oslo']
+    frames = iter(range(1 << 30))
+
+    def render(data, name, invalidate=False):
+        if invalidate:
+            service.layout.invalidate()
+        # Measure rendering, not the per-location frame cache
+        service.frames.clear()
+        buffer = service.render_frame(data, name)
+        service.frame_damage.pop(id(buffer), None)
+        service.frame_pool.release(buffer)
+
+    # Every widget redrawn, e.g. the first frame or a location switch
+    metrics['render_full_us'] = time_us(lambda: render(weather[0], names[0], True), scaled(100, scale))
+
+    # Only the temperature changes, the usual hourly update
+    current = weather[0].current
+    readings = [weather[0], weather[0].replace(current=current.replace(temperature=current.temperature + 0.1))]
+    metrics['render_incremental_us'] = time_us(
+        lambda: render(readings[next(frames) % 2], names[0]), scaled(200, scale))
+
+    # update_display end to end through the driver, alternating locations
+    def update(cached=False):
+        index = next(frames) % len(weather)
+        if not cached:
+            service.frames.clear()
+        service.update_display(weather[index], names[index])
+    metrics['update_display_us'] = time_us(update, scaled(20, scale))
+    # Rotation through locations whose frames are cached
+    metrics['rotate_cached_us'] = time_us(lambda: update(cached=True), scaled(20, scale))
+
+
+def bench_packing(metrics, service, scale):
+    canvas = service.frame_pool.canvas
+    out = bytearray(packed_size(service.epd.width, service.epd.height))
+    metrics['getbuffer_us'] = time_us(lambda: service.epd.getbuffer(canvas), scaled(500, scale))
+    metrics['pack_into_us'] = time_us(lambda: pack_into(canvas, out), scaled(500, scale))
+
+
+def bench_spi(metrics, weather):
+    """SPI traffic of each refresh kind in a deterministic sequence of frames."""
+    recorder = epdconfig.implementation
+    service = DisplayService(refresh_policy=RefreshPolicy())
+    names = ['Birmingham, AL', 'Calicut, Kerala']
+    current = weather[0].current
+    warmer = weather[0].replace(current=current.replace(temperature=current.temperature + 1.0))
+
+    steps = [
+        ('full_refresh', weather[0], names[0]),
+        ('temperature_change', warmer, names[0]),
+        ('location_switch', weather[1], names[1]),
+        ('unchanged', weather[1], names[1]),
+        # Back to a location whose frame is cached: one upload, no render
+        ('rotate_back', warmer, names[0]),
+    ]
+    for name, data, location in steps:
+        recorder.reset_stats()
+        service.update_display(data, location)
+        metrics[f'{name}_spi_transactions'] = recorder.spi_transactions
+        metrics[f'{name}_spi_bytes'] = recorder.spi_bytes
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scale=1):
+    weather = [WeatherService.normalize(item) for item in json.loads(load_fixture('open_meteo_batch.json'))]
+    service = DisplayService()
+
+    metrics = {}
+    bench_parsing(metrics, scale)
+    bench_icons(metrics, service, scale)
+    bench_rendering(metrics, service, weather, scale)
+    bench_packing(metrics, service, scale)
+    bench_spi(metrics, weather)
+    return {
+        'version': RESULTS_VERSION,
+        'meta': {
+            'commit': git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'machine': platform.machine(),
+            'node': platform.node(),
+        },
+        'metrics': metrics,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Check results against a baseline run.
+
+    Args:
+        results, baseline: Result dicts as returned by run()
+        threshold: Allowed relative slowdown of timings, e.g. 0.2 for 20%
+
+    Returns:
+        List of (metric, baseline value, new value) that regressed
+    """
+    regressions = []
+    for name, old in baseline['metrics'].items():
+        new = results['metrics'].get(name)
+        if new is None:
+            continue
+        if name.endswith(TIME_SUFFIX) and new > old * (1 + threshold):
+            regressions.append((name, old, new))
+        elif name.endswith(COUNT_SUFFIXES) and new > old:
+            regressions.append((name, old, new))
+    return regressions
+
+
+def print_table(results, baseline=None):
+    old_metrics = baseline['metrics'] if baseline else {}
+    for name, value in results['metrics'].items():
+        line = f"{name:34s} {value:12.1f}" if name.endswith(TIME_SUFFIX) else f"{name:34s} {value:12d}"
+        old = old_metrics.get(name)
+        if old:
+            line += f"  {(value - old) / old * 100:+7.1f}%"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="compare against results from an earlier run")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative slowdown of timings (default %(default)s)")
+    parser.add_argument('--scale', type=float, default=1,
+                        help="multiply iteration counts, for noisy machines")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('version') != RESULTS_VERSION:
+            parser.error(f"{args.baseline} has results version {baseline.get('version')}, expected {RESULTS_VERSION}")
+
+    results = run(args.scale)
+    print_table(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if baseline is None:
+        return 0
+    if baseline['meta'].get('machine') != results['meta']['machine']:
+        print(f"Warning: baseline was recorded on {baseline['meta'].get('machine')}, timings are not comparable")
+    regressions = compare(results, baseline, args.threshold)
+    for name, old, new in regressions:
+        print(f"REGRESSION {name}: {old:g} -> {new:g}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
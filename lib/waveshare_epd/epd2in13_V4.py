@@ -1,11 +1,135 @@
+import time
 import logging
+import contextlib
+from collections import deque
+from PIL import Image
 from . import epdconfig
 
 EPD_WIDTH       = 122
 EPD_HEIGHT      = 250
 
+# Seconds to wait for BUSY to drop; a full refresh takes about 2-4 s
+BUSY_TIMEOUT    = 10
+
 logger = logging.getLogger(__name__)
 
+'''
+function : Register sequence setting the RAM window
+parameter:
+    x_start, y_start, x_end, y_end : Window in pixels, x is truncated to bytes
+return : tuple of (command, data bytes)
+'''
+def window_sequence(x_start, y_start, x_end, y_end):
+    return (
+        (0x44, bytes(((x_start>>3) & 0xFF, (x_end>>3) & 0xFF))), # SET_RAM_X_ADDRESS_START_END_POSITION
+        (0x45, bytes((y_start & 0xFF, (y_start >> 8) & 0xFF,      # SET_RAM_Y_ADDRESS_START_END_POSITION
+                      y_end & 0xFF, (y_end >> 8) & 0xFF))),
+    )
+
+'''
+function : Register sequence setting the RAM address counters
+parameter:
+    x : X-axis starting position in bytes
+    y : Y-axis starting position
+return : tuple of (command, data bytes)
+'''
+def cursor_sequence(x, y):
+    return (
+        (0x4E, bytes((x & 0xFF,))),                   # SET_RAM_X_ADDRESS_COUNTER
+        (0x4F, bytes((y & 0xFF, (y >> 8) & 0xFF))),   # SET_RAM_Y_ADDRESS_COUNTER
+    )
+
+# Precompiled register sequences, sent with EPD.send_sequence
+FULL_WINDOW_SEQUENCE = window_sequence(0, 0, EPD_WIDTH - 1, EPD_HEIGHT - 1) + cursor_sequence(0, 0)
+
+INIT_SEQUENCE = (
+    (0x01, b'\xf9\x00\x00'),     # Driver output control
+    (0x11, b'\x03'),             # data entry mode
+) + FULL_WINDOW_SEQUENCE + (
+    (0x3C, b'\x05'),             # BorderWavefrom
+    (0x21, b'\x00\x80'),         # Display update control
+    (0x18, b'\x80'),             # Read built-in temperature sensor
+)
+
+INIT_FAST_SEQUENCE = (
+    (0x18, b'\x80'),             # Read built-in temperature sensor
+    (0x11, b'\x03'),             # data entry mode
+) + FULL_WINDOW_SEQUENCE + (
+    (0x22, b'\xB1'),             # Load temperature value
+    (0x20, b''),
+)
+
+INIT_FAST_TEMPERATURE_SEQUENCE = (
+    (0x1A, b'\x64\x00'),         # Write to temperature register
+    (0x22, b'\x91'),             # Load temperature value
+    (0x20, b''),
+)
+
+PARTIAL_PREAMBLE_SEQUENCE = (
+    (0x3C, b'\x80'),             # BorderWavefrom
+    (0x01, b'\xF9\x00\x00'),     # Driver output control
+    (0x11, b'\x03'),             # data entry mode
+)
+
+TURN_ON_FULL_SEQUENCE = ((0x22, b'\xF7'), (0x20, b''))      # Display Update Control, Activate
+TURN_ON_FAST_SEQUENCE = ((0x22, b'\xC7'), (0x20, b''))      # fast:0x0c, quality:0x0f, 0xcf
+TURN_ON_PART_SEQUENCE = ((0x22, b'\xFF'), (0x20, b''))
+
+'''
+function : Find the byte-aligned bands that differ between two packed buffers
+parameter:
+    previous : Packed buffer currently in controller RAM
+    image : New packed buffer
+    linewidth : Bytes per row
+    merge_gap : Unchanged rows that may be folded into a band, since every
+                extra band costs a window/cursor command round trip
+    rows : Optional (first, last) rows known to contain every change
+return : list of (x_start_byte, y_start, x_end_byte, y_end), all inclusive
+'''
+def get_dirty_bands(previous, image, linewidth, merge_gap=2, rows=None):
+    bands = []
+    band = None
+    last_dirty = None
+    height = len(image) // linewidth
+    first_row, last_row = rows if rows is not None else (0, height - 1)
+    for y in range(max(first_row, 0), min(last_row, height - 1) + 1):
+        start = y * linewidth
+        old_row = previous[start:start + linewidth]
+        new_row = image[start:start + linewidth]
+        if old_row == new_row:
+            continue
+        x_first = 0
+        while old_row[x_first] == new_row[x_first]:
+            x_first += 1
+        x_last = linewidth - 1
+        while old_row[x_last] == new_row[x_last]:
+            x_last -= 1
+
+        if band is not None and y - last_dirty - 1 <= merge_gap:
+            band[0] = min(band[0], x_first)
+            band[2] = max(band[2], x_last)
+            band[3] = y
+        else:
+            if band is not None:
+                bands.append(tuple(band))
+            band = [x_first, y, x_last, y]
+        last_dirty = y
+    if band is not None:
+        bands.append(tuple(band))
+    return bands
+
+_NO_SPAN = contextlib.nullcontext()
+
+'''
+function : Default instrumentation hook, a no-op
+parameter:
+    name : Stage name, e.g. 'spi_upload' or 'busy_wait'
+    labels : Extra labels, e.g. kind='partial'
+return : context manager timing the stage
+'''
+def no_span(name, **labels):
+    return _NO_SPAN
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -14,6 +138,13 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        # Measured (kind, milliseconds) of recent BUSY waits
+        self.busy_history = deque(maxlen=32)
+        self.last_busy_ms = None
+        self._blank_frames = {}
+        # Replaced by the application to time SPI uploads and BUSY waits,
+        # e.g. with src.metrics.span
+        self.span = no_span
 
     '''
     function :Hardware reset
@@ -56,45 +187,63 @@ class EPD:
         epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send commands with their data
+    parameter:
+     sequence : iterable of (command, data bytes); each entry costs one DC
+                toggle and one bulk SPI write instead of one per data byte
+    '''
+    def send_sequence(self, sequence):
+        for command, data in sequence:
+            epdconfig.digital_write(self.dc_pin, 0)
+            epdconfig.digital_write(self.cs_pin, 0)
+            epdconfig.spi_writebyte([command])
+            if data:
+                epdconfig.digital_write(self.dc_pin, 1)
+                epdconfig.spi_writebyte2(data)
+            epdconfig.digital_write(self.cs_pin, 1)
+
     '''
     function :Wait until the busy_pin goes LOW
     parameter:
+        kind : What the panel is busy with, recorded with the duration
+        timeout : Seconds before epdconfig.BusyTimeoutError is raised
+    return : Busy duration in milliseconds
     '''
-    def ReadBusy(self):
+    def ReadBusy(self, kind='busy', timeout=BUSY_TIMEOUT):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(10)  
-        logger.debug("e-Paper busy release")
+        start = time.monotonic()
+        with self.span('busy_wait', kind=kind):
+            epdconfig.wait_busy_release(timeout)  # 0: idle, 1: busy
+        elapsed_ms = (time.monotonic() - start) * 1000
+        self.last_busy_ms = elapsed_ms
+        self.busy_history.append((kind, elapsed_ms))
+        logger.debug("e-Paper busy release after %.0f ms (%s)", elapsed_ms, kind)
+        return elapsed_ms
 
     '''
     function : Turn On Display
     parameter:
     '''
     def TurnOnDisplay(self):
-        self.send_command(0x22) # Display Update Control
-        self.send_data(0xf7)
-        self.send_command(0x20) # Activate Display Update Sequence
-        self.ReadBusy()
+        self.send_sequence(TURN_ON_FULL_SEQUENCE)
+        self.ReadBusy('full')
 
     '''
     function : Turn On Display Fast
     parameter:
     '''
     def TurnOnDisplay_Fast(self):
-        self.send_command(0x22) # Display Update Control
-        self.send_data(0xC7)    # fast:0x0c, quality:0x0f, 0xcf
-        self.send_command(0x20) # Activate Display Update Sequence
-        self.ReadBusy()
+        self.send_sequence(TURN_ON_FAST_SEQUENCE)
+        self.ReadBusy('fast')
 
     '''
     function : Turn On Display Part
     parameter:
     '''
     def TurnOnDisplayPart(self):
-        self.send_command(0x22) # Display Update Control
-        self.send_data(0xff)    # fast:0x0c, quality:0x0f, 0xcf
-        self.send_command(0x20) # Activate Display Update Sequence
-        self.ReadBusy()
+        self.send_sequence(TURN_ON_PART_SEQUENCE)
+        self.ReadBusy('partial')
 
 
     '''
@@ -106,16 +255,8 @@ class EPD:
         yend : End position of Y-axis
     '''
     def SetWindow(self, x_start, y_start, x_end, y_end):
-        self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
         # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data((x_start>>3) & 0xFF)
-        self.send_data((x_end>>3) & 0xFF)
-
-        self.send_command(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(y_start & 0xFF)
-        self.send_data((y_start >> 8) & 0xFF)
-        self.send_data(y_end & 0xFF)
-        self.send_data((y_end >> 8) & 0xFF)
+        self.send_sequence(window_sequence(x_start, y_start, x_end, y_end))
 
     '''
     function : Set Cursor
@@ -124,13 +265,7 @@ class EPD:
         y : Y-axis starting position
     '''
     def SetCursor(self, x, y):
-        self.send_command(0x4E) # SET_RAM_X_ADDRESS_COUNTER
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data(x & 0xFF)
-
-        self.send_command(0x4F) # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(y & 0xFF)
-        self.send_data((y >> 8) & 0xFF)
+        self.send_sequence(cursor_sequence(x, y))
 
     '''
     function : Initialize the e-Paper register
@@ -146,27 +281,7 @@ class EPD:
         self.send_command(0x12)  #SWRESET
         self.ReadBusy() 
 
-        self.send_command(0x01) #Driver output control      
-        self.send_data(0xf9)
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x11) #data entry mode
-        self.send_data(0x03)
-
-        self.SetWindow(0, 0, self.width-1, self.height-1)
-        self.SetCursor(0, 0)
-
-        self.send_command(0x3c)
-        self.send_data(0x05)
-
-        self.send_command(0x21) #  Display update control
-        self.send_data(0x00)
-        self.send_data(0x80)
-
-        self.send_command(0x18)
-        self.send_data(0x80)
-
+        self.send_sequence(INIT_SEQUENCE)
         self.ReadBusy()
 
         return 0
@@ -184,27 +299,10 @@ class EPD:
         self.send_command(0x12)  #SWRESET
         self.ReadBusy() 
 
-        self.send_command(0x18) # Read built-in temperature sensor
-        self.send_command(0x80)
-
-        self.send_command(0x11) # data entry mode       
-        self.send_data(0x03)    
-
-        self.SetWindow(0, 0, self.width-1, self.height-1)
-        self.SetCursor(0, 0)
-
-        self.send_command(0x22) # Load temperature value
-        self.send_data(0xB1)	
-        self.send_command(0x20)
+        self.send_sequence(INIT_FAST_SEQUENCE)
         self.ReadBusy()
 
-        self.send_command(0x1A) # Write to temperature register
-        self.send_data(0x64)
-        self.send_data(0x00)
-
-        self.send_command(0x22) # Load temperature value
-        self.send_data(0x91)	
-        self.send_command(0x20)
+        self.send_sequence(INIT_FAST_TEMPERATURE_SEQUENCE)
         self.ReadBusy()
 
         return 0
@@ -216,15 +314,17 @@ class EPD:
     def getbuffer(self, image):
         img = image
         imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
+        if img.mode != '1':
             img = img.convert('1')
+        if(imwidth == self.width and imheight == self.height):
+            pass
         elif(imwidth == self.height and imheight == self.width):
             # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
+            img = img.transpose(Image.ROTATE_90)
         else:
             logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
             # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
+            return bytearray(self.linewidth() * self.height)
 
         buf = bytearray(img.tobytes('raw'))
         return buf
@@ -258,23 +358,51 @@ class EPD:
         epdconfig.delay_ms(1)
         epdconfig.digital_write(self.reset_pin, 1)  
 
-        self.send_command(0x3C) # BorderWavefrom
-        self.send_data(0x80)
-
-        self.send_command(0x01) # Driver output control      
-        self.send_data(0xF9) 
-        self.send_data(0x00)
-        self.send_data(0x00)
+        with self.span('spi_upload'):
+            self.send_sequence(PARTIAL_PREAMBLE_SEQUENCE + FULL_WINDOW_SEQUENCE)
+            self.send_sequence(((0x24, image),)) # WRITE_RAM
+        self.TurnOnDisplayPart()
 
-        self.send_command(0x11) # data entry mode       
-        self.send_data(0x03)
+    '''
+    function : Partial refresh uploading only the bands that changed
+    parameter:
+        image : Image data
+        previous : Image data currently in RAM (what the panel shows)
+        rows : Optional (first, last) rows expected to contain every change;
+               all rows are compared if these show none
+    return : list of uploaded bands, see get_dirty_bands
+    '''
+    def displayPartialWindow(self, image, previous, rows=None):
+        linewidth = self.linewidth()
+        if previous is None or len(previous) != len(image):
+            self.displayPartial(image)
+            return [(0, 0, linewidth - 1, self.height - 1)]
+
+        bands = get_dirty_bands(previous, image, linewidth, rows=rows)
+        if not bands and rows is not None and previous != image:
+            # The hint missed a change, compare every row instead
+            bands = get_dirty_bands(previous, image, linewidth)
+        if not bands:
+            return bands
 
-        self.SetWindow(0, 0, self.width - 1, self.height - 1)
-        self.SetCursor(0, 0)
+        epdconfig.digital_write(self.reset_pin, 0)
+        epdconfig.delay_ms(1)
+        epdconfig.digital_write(self.reset_pin, 1)
 
-        self.send_command(0x24) # WRITE_RAM
-        self.send_data2(image)  
+        sequence = list(PARTIAL_PREAMBLE_SEQUENCE)
+        for x_start, y_start, x_end, y_end in bands:
+            band = bytearray()
+            for y in range(y_start, y_end + 1):
+                row = y * linewidth
+                band += image[row + x_start:row + x_end + 1]
+            sequence += window_sequence(x_start * 8, y_start, x_end * 8, y_end)
+            sequence += cursor_sequence(x_start, y_start)
+            sequence.append((0x24, band)) # WRITE_RAM
+        sequence += FULL_WINDOW_SEQUENCE
+        with self.span('spi_upload'):
+            self.send_sequence(sequence)
         self.TurnOnDisplayPart()
+        return bands
 
     '''
     function : Refresh a base image
@@ -282,26 +410,73 @@ class EPD:
         image : Image data
     '''
     def displayPartBaseImage(self, image):
-        self.send_command(0x24)
-        self.send_data2(image)  
+        with self.span('spi_upload'):
+            self.send_command(0x24)
+            self.send_data2(image)
 
-        self.send_command(0x26)
-        self.send_data2(image)  
+            self.send_command(0x26)
+            self.send_data2(image)
         self.TurnOnDisplay()
 
+    '''
+    function : Load a base image into both RAMs without refreshing, for a
+               panel that already shows it (e.g. after a service restart)
+    parameter:
+        image : Image data
+    '''
+    def writeBaseImage(self, image):
+        with self.span('spi_upload'):
+            self.send_command(0x24)
+            self.send_data2(image)
+
+            self.send_command(0x26)
+            self.send_data2(image)
+
+    '''
+    function : Fast refresh a base image (call init_fast first)
+    parameter:
+        image : Image data
+    '''
+    def displayFastBaseImage(self, image):
+        with self.span('spi_upload'):
+            self.send_command(0x24)
+            self.send_data2(image)
+
+            self.send_command(0x26)
+            self.send_data2(image)
+        self.TurnOnDisplay_Fast()
+
+    '''
+    function : Bytes per row of the packed buffer
+    parameter:
+    '''
+    def linewidth(self):
+        if self.width%8 == 0:
+            return int(self.width/8)
+        return int(self.width/8) + 1
+
+    '''
+    function : Constant single-colour frame, built once per colour
+    parameter:
+        color : Byte every pixel group is set to
+    '''
+    def blank_frame(self, color=0xFF):
+        frame = self._blank_frames.get(color)
+        if frame is None:
+            frame = bytes([color]) * (self.linewidth() * self.height)
+            self._blank_frames[color] = frame
+        return frame
+
     '''
     function : Clear screen
     parameter:
     '''
     def Clear(self, color=0xFF):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
+        linewidth = self.linewidth()
         # logger.debug(linewidth)
 
         self.send_command(0x24)
-        self.send_data2([color] * int(self.height * linewidth))  
+        self.send_data2(self.blank_frame(color))
         self.TurnOnDisplay()
 
     '''
@@ -2,12 +2,23 @@ import os
 import logging
 import sys
 import time
-import subprocess
+import struct
 
 from ctypes import *
 
 logger = logging.getLogger(__name__)
 
+# Largest buffer handed to a bulk SPI transfer in one call
+SPI_CHUNK_SIZE = 4096
+
+# Longest edge wait before the BUSY level is checked again, guards against
+# an edge that happens between the level check and arming the wait
+BUSY_EDGE_SLICE_MS = 250
+
+
+class BusyTimeoutError(TimeoutError):
+    """The panel kept BUSY high past the deadline (disconnected or faulty)."""
+
 
 class RaspberryPi:
     # Pin definition
@@ -69,6 +80,12 @@ class RaspberryPi:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy_release(self, timeout):
+        # Button is active while BUSY is high, wait_for_release blocks on an
+        # event set from the GPIO edge callback instead of polling
+        if not self.GPIO_BUSY_PIN.wait_for_release(timeout):
+            raise BusyTimeoutError("e-Paper busy for more than %.1f s" % timeout)
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
@@ -94,9 +111,10 @@ class RaspberryPi:
                 '/usr/lib',
             ]
             self.DEV_SPI = None
+            # Bitness of this interpreter, which is what CDLL can load
+            val = struct.calcsize('P') * 8
+            logging.debug("System is %d bit"%val)
             for find_dir in find_dirs:
-                val = int(os.popen('getconf LONG_BIT').read())
-                logging.debug("System is %d bit"%val)
                 if val == 64:
                     so_filename = os.path.join(find_dir, 'DEV_Config_64.so')
                 else:
@@ -136,6 +154,17 @@ class RaspberryPi:
 
 
 
+def _wait_falling_edge(gpio, pin, timeout):
+    # Jetson.GPIO and Hobot.GPIO share the RPi.GPIO style wait_for_edge API,
+    # which returns None when its timeout (in ms) expires
+    deadline = time.monotonic() + timeout
+    while gpio.input(pin) == 1:
+        remaining_ms = int((deadline - time.monotonic()) * 1000)
+        if remaining_ms <= 0:
+            raise BusyTimeoutError("e-Paper busy for more than %.1f s" % timeout)
+        gpio.wait_for_edge(pin, gpio.FALLING, timeout=min(remaining_ms, BUSY_EDGE_SLICE_MS))
+
+
 class JetsonNano:
     # Pin definition
     RST_PIN  = 17
@@ -159,10 +188,23 @@ class JetsonNano:
                 break
         if self.SPI is None:
             raise RuntimeError('Cannot find sysfs_software_spi.so')
+        self.SPI.SYSFS_software_spi_transfer.argtypes = [ctypes.c_uint8]
+        # The header's SPI1 controller, once enabled with jetson-io, moves a
+        # whole frame per ioctl; bit-banging costs one FFI call per byte
+        self.HW_SPI = None
+        if os.path.exists('/dev/spidev0.0'):
+            try:
+                import spidev
+                self.HW_SPI = spidev.SpiDev()
+            except ImportError:
+                logger.debug("spidev not installed, using software SPI")
         import Jetson.GPIO
         self.GPIO = Jetson.GPIO
 
     def digital_write(self, pin, value):
+        # Hardware SPI drives CS itself
+        if pin == self.CS_PIN and self.HW_SPI is not None:
+            return
         self.GPIO.output(pin, value)
 
     def digital_read(self, pin):
@@ -171,37 +213,67 @@ class JetsonNano:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy_release(self, timeout):
+        _wait_falling_edge(self.GPIO, self.BUSY_PIN, timeout)
+
     def spi_writebyte(self, data):
-        self.SPI.SYSFS_software_spi_transfer(data[0])
+        if self.HW_SPI is not None:
+            self.HW_SPI.writebytes(data)
+        else:
+            self.SPI.SYSFS_software_spi_transfer(data[0])
 
     def spi_writebyte2(self, data):
-        for i in range(len(data)):
-            self.SPI.SYSFS_software_spi_transfer(data[i])
+        # Accepts bytes, bytearray, memoryview or a list of ints
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        view = memoryview(data).cast('B')
+        if self.HW_SPI is not None:
+            # writebytes2 splits into spidev-sized transfers itself, the
+            # chunks only bound how much is pinned per call
+            for start in range(0, len(view), SPI_CHUNK_SIZE):
+                self.HW_SPI.writebytes2(view[start:start + SPI_CHUNK_SIZE])
+        else:
+            transfer = self.SPI.SYSFS_software_spi_transfer
+            for byte in view:
+                transfer(byte)
 
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.DC_PIN, self.GPIO.OUT)
-        self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
+        if self.HW_SPI is None:
+            self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.PWR_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.BUSY_PIN, self.GPIO.IN)
 
         self.GPIO.output(self.PWR_PIN, 1)
 
-        self.SPI.SYSFS_software_spi_begin()
+        if self.HW_SPI is not None:
+            # SPI device, bus = 0, device = 0
+            self.HW_SPI.open(0, 0)
+            self.HW_SPI.max_speed_hz = 4000000
+            self.HW_SPI.mode = 0b00
+        else:
+            self.SPI.SYSFS_software_spi_begin()
         return 0
 
     def module_exit(self):
         logger.debug("spi end")
-        self.SPI.SYSFS_software_spi_end()
+        if self.HW_SPI is not None:
+            self.HW_SPI.close()
+        else:
+            self.SPI.SYSFS_software_spi_end()
 
         logger.debug("close 5V, Module enters 0 power consumption ...")
         self.GPIO.output(self.RST_PIN, 0)
         self.GPIO.output(self.DC_PIN, 0)
         self.GPIO.output(self.PWR_PIN, 0)
 
-        self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN, self.PWR_PIN])
+        pins = [self.RST_PIN, self.DC_PIN, self.BUSY_PIN, self.PWR_PIN]
+        if self.HW_SPI is None:
+            pins.append(self.CS_PIN)
+        self.GPIO.cleanup(pins)
 
 
 class SunriseX3:
@@ -229,13 +301,17 @@ class SunriseX3:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy_release(self, timeout):
+        _wait_falling_edge(self.GPIO, self.BUSY_PIN, timeout)
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
     def spi_writebyte2(self, data):
-        # for i in range(len(data)):
-        #     self.SPI.writebytes([data[i]])
-        self.SPI.xfer3(data)
+        # writebytes2 takes any buffer-protocol object directly and splits it
+        # into spidev-sized transfers, xfer3 copied it into a list first and
+        # read back a reply nobody uses
+        self.SPI.writebytes2(data)
 
     def module_init(self):
         if self.Flag == 0:
@@ -271,20 +347,215 @@ class SunriseX3:
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN], self.PWR_PIN)
 
 
-if sys.version_info[0] == 2:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE)
-else:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE, text=True)
-output, _ = process.communicate()
-if sys.version_info[0] == 2:
-    output = output.decode(sys.stdout.encoding)
+class Recorder:
+    """Hardware-free backend that records every GPIO and SPI operation.
 
-if "Raspberry" in output:
-    implementation = RaspberryPi()
-elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
-    implementation = SunriseX3()
-else:
-    implementation = JetsonNano()
+    Delays and BUSY waits return immediately, so driver code runs at full
+    speed and the traffic it generates can be counted, e.g. SPI transactions
+    and bytes per refresh. Select it with EPD_BACKEND=recording.
+    """
+    # Pin definition
+    RST_PIN  = 17
+    DC_PIN   = 25
+    CS_PIN   = 8
+    BUSY_PIN = 24
+    PWR_PIN  = 18
+
+    def __init__(self):
+        self.reset_stats()
 
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
+    def reset_stats(self):
+        self.gpio_writes = 0
+        self.spi_transactions = 0
+        self.spi_bytes = 0
+        self.delay_total_ms = 0
+        # (dc level, bytes) per SPI transaction
+        self.trace = []
+        self.dc = 0
+
+    def digital_write(self, pin, value):
+        self.gpio_writes += 1
+        if pin == self.DC_PIN:
+            self.dc = value
+
+    def digital_read(self, pin):
+        return 0
+
+    def delay_ms(self, delaytime):
+        self.delay_total_ms += delaytime
+
+    def wait_busy_release(self, timeout):
+        pass
+
+    def spi_writebyte(self, data):
+        self.spi_transactions += 1
+        self.spi_bytes += len(data)
+        self.trace.append((self.dc, bytes(data)))
+
+    def spi_writebyte2(self, data):
+        self.spi_writebyte(data)
+
+    def module_init(self, cleanup=False):
+        return 0
+
+    def module_exit(self, cleanup=False):
+        pass
+
+
+class Simulator(Recorder):
+    """Hardware-free backend emulating an SSD1680 panel with a timing model.
+
+    The command stream is decoded by simulator.SSD1680, time runs on a
+    virtual clock (delays, SPI transfer time at SPI_HZ and modeled BUSY
+    waveforms advance it instantly), and every transaction is kept in a
+    byte-level trace. Select it with EPD_BACKEND=simulator; if EPD_SIM_DIR
+    is set, a PNG snapshot is written there after every display update and
+    the SPI trace when the module exits.
+    """
+    SPI_HZ = 4000000
+
+    def __init__(self):
+        from .simulator import SSD1680
+        self.controller = SSD1680()
+        self.clock_ms = 0.0
+        self.busy_until_ms = 0.0
+        self.output_dir = os.environ.get('EPD_SIM_DIR')
+        self.frames_written = 0
+        Recorder.__init__(self)
+
+    def reset_stats(self):
+        Recorder.reset_stats(self)
+        self.spi_trace = []     # (clock ms, dc level, bytes)
+        self.busy_ms = []       # (waveform, ms) per update
+
+    def digital_write(self, pin, value):
+        Recorder.digital_write(self, pin, value)
+        if pin == self.RST_PIN and not value:
+            self.controller.reset()
+
+    def digital_read(self, pin):
+        if pin == self.BUSY_PIN:
+            return 1 if self.clock_ms < self.busy_until_ms else 0
+        return 0
+
+    def delay_ms(self, delaytime):
+        Recorder.delay_ms(self, delaytime)
+        self.clock_ms += delaytime
+
+    def wait_busy_release(self, timeout):
+        remaining = self.busy_until_ms - self.clock_ms
+        if remaining > timeout * 1000:
+            self.clock_ms += timeout * 1000
+            raise BusyTimeoutError("e-Paper busy for more than %.1f s" % timeout)
+        self.clock_ms = max(self.clock_ms, self.busy_until_ms)
+
+    def spi_writebyte(self, data):
+        data = bytes(data)
+        Recorder.spi_writebyte(self, data)
+        self.spi_trace.append((self.clock_ms, self.dc, data))
+        self.clock_ms += len(data) * 8 * 1000.0 / self.SPI_HZ
+        updates = len(self.controller.updates)
+        busy = self.controller.write(self.dc, data)
+        if busy:
+            self.busy_until_ms = self.clock_ms + busy
+            self.busy_ms.append((self.controller.waveform() if data[-1] == 0x20 else 'reset', busy))
+        if len(self.controller.updates) != updates:
+            self._snapshot_update()
+
+    def spi_writebyte2(self, data):
+        self.spi_writebyte(data)
+
+    def _snapshot_update(self):
+        if not self.output_dir:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.frames_written += 1
+        name = 'frame_%04d_%s.png' % (self.frames_written, self.controller.updates[-1])
+        self.snapshot(os.path.join(self.output_dir, name))
+
+    def snapshot(self, path):
+        """Write the emulated panel as a PNG in the panel's native orientation."""
+        self.controller.image().save(path)
+
+    def dump_trace(self, path):
+        """Write the SPI trace, one transaction per line: time, C/D, hex bytes."""
+        with open(path, 'w') as f:
+            for clock_ms, dc, data in self.spi_trace:
+                f.write('%10.3f %s %s\n' % (clock_ms, 'D' if dc else 'C', data.hex()))
+
+    def module_exit(self, cleanup=False):
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.dump_trace(os.path.join(self.output_dir, 'spi_trace.txt'))
+
+
+BACKENDS = {
+    'raspberrypi': RaspberryPi,
+    'jetson': JetsonNano,
+    'sunrise': SunriseX3,
+    'recording': Recorder,
+    'simulator': Simulator,
+}
+
+# Pin numbers can be read from the backend class without constructing it
+_PIN_NAMES = ('RST_PIN', 'DC_PIN', 'CS_PIN', 'BUSY_PIN', 'PWR_PIN')
+
+_platform = None
+_implementation = None
+
+
+def _read_text(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8', 'replace')
+    except OSError:
+        return ''
+
+
+def detect_platform():
+    """Name of the backend to use, a key of BACKENDS.
+
+    EPD_BACKEND overrides detection. Otherwise the device-tree model (or
+    /proc/cpuinfo when there is no device tree) is read directly instead of
+    spawning a shell, and the result is cached for the process.
+    """
+    global _platform
+    if _platform is not None:
+        return _platform
+
+    override = os.environ.get('EPD_BACKEND')
+    if override:
+        if override.lower() not in BACKENDS:
+            raise ValueError("Unknown EPD_BACKEND %r, expected one of %s" % (override, ', '.join(BACKENDS)))
+        _platform = override.lower()
+    elif 'Raspberry' in (_read_text('/proc/device-tree/model') or _read_text('/proc/cpuinfo')):
+        _platform = 'raspberrypi'
+    elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
+        _platform = 'sunrise'
+    else:
+        _platform = 'jetson'
+    return _platform
+
+
+def get_implementation():
+    """Construct the platform backend on first use and bind its functions
+    (digital_write, spi_writebyte, ...) as module attributes."""
+    global _implementation
+    if _implementation is None:
+        implementation = BACKENDS[detect_platform()]()
+        for func in [x for x in dir(implementation) if not x.startswith('_')]:
+            setattr(sys.modules[__name__], func, getattr(implementation, func))
+        _implementation = implementation
+    return _implementation
+
+
+def __getattr__(name):
+    # Only reached for names not bound yet, so importing this module never
+    # touches GPIO/SPI; the backend is built when the driver first needs it
+    if name == 'implementation':
+        return get_implementation()
+    if name in _PIN_NAMES:
+        return getattr(BACKENDS[detect_platform()], name)
+    if name.startswith('_'):
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    return getattr(get_implementation(), name)
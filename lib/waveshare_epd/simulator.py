@@ -0,0 +1,152 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Controller RAM of the SSD1680 (176 sources x 296 gates); the 2.13" V4 glass
+# shows the top-left 122x250 of it
+RAM_X_BYTES = 22
+RAM_Y = 296
+
+# Modeled BUSY durations in ms per update sequence, taken from Waveshare's
+# datasheet figures for the 2.13" V4 at room temperature
+WAVEFORM_MS = {
+    'full': 2000,
+    'fast': 1500,
+    'partial': 300,
+    'load': 60,      # Temperature/LUT load without a display update
+    'reset': 10,     # SWRESET
+}
+
+
+class SSD1680:
+    """Behavioral model of the SSD1680 controller's command interface.
+
+    Decodes the byte stream the driver sends: RAM writes to 0x24/0x26 with
+    window (0x44/0x45), cursor (0x4E/0x4F) and data entry mode (0x11)
+    addressing, and update sequences via 0x22/0x20. Updates copy RAM into an
+    emulated panel and report how long BUSY would stay high.
+    """
+
+    def __init__(self, width=122, height=250):
+        self.width = width
+        self.height = height
+        self.linewidth = (width + 7) // 8
+        self.ram = {0x24: bytearray(b'\xff' * (RAM_X_BYTES * RAM_Y)),
+                    0x26: bytearray(b'\xff' * (RAM_X_BYTES * RAM_Y))}
+        # What the glass shows, packed like EPD.getbuffer
+        self.panel = bytearray(b'\xff' * (self.linewidth * height))
+        self.registers = {}
+        self.updates = []
+        self.sleeping = False
+        self.reset()
+
+    def reset(self):
+        """Hardware or software reset: registers go back to defaults, RAM is kept."""
+        self.command = None
+        self.args = bytearray()
+        self.data_entry = 0x03
+        self.x_start, self.x_end = 0, RAM_X_BYTES - 1
+        self.y_start, self.y_end = 0, RAM_Y - 1
+        self.x, self.y = 0, 0
+        self.update_control = 0xFF
+        self.sleeping = False
+
+    def write(self, dc, data):
+        """Feed one SPI transaction; returns BUSY ms caused by it (0 if none)."""
+        busy_ms = 0
+        if dc == 0:
+            for command in data:
+                busy_ms += self._begin(command)
+        else:
+            for value in data:
+                self._data(value)
+        return busy_ms
+
+    def _begin(self, command):
+        self.command = command
+        self.args = bytearray()
+        if command == 0x12:     # SWRESET
+            self.reset()
+            return WAVEFORM_MS['reset']
+        if command == 0x20:     # Master activation
+            return self._activate()
+        return 0
+
+    def _data(self, value):
+        command = self.command
+        if command in (0x24, 0x26):
+            self._write_ram(command, value)
+            return
+        self.args.append(value)
+        args = self.args
+        if command == 0x11:
+            self.data_entry = args[0] & 0x07
+        elif command == 0x44 and len(args) == 2:
+            self.x_start, self.x_end = args[0] & 0x3F, args[1] & 0x3F
+        elif command == 0x45 and len(args) == 4:
+            self.y_start = args[0] | (args[1] & 0x01) << 8
+            self.y_end = args[2] | (args[3] & 0x01) << 8
+        elif command == 0x4E:
+            self.x = args[0] & 0x3F
+        elif command == 0x4F and len(args) == 2:
+            self.y = args[0] | (args[1] & 0x01) << 8
+        elif command == 0x22:
+            self.update_control = args[0]
+        elif command == 0x10:
+            self.sleeping = bool(args[0] & 0x03)
+        self.registers[command] = bytes(args)
+
+    def _write_ram(self, ram, value):
+        if 0 <= self.x < RAM_X_BYTES and 0 <= self.y < RAM_Y:
+            self.ram[ram][self.y * RAM_X_BYTES + self.x] = value
+        # Advance the address counter inside the window per data entry mode:
+        # bit 0 X increments, bit 1 Y increments, bit 2 Y is updated first
+        x_step = 1 if self.data_entry & 0x01 else -1
+        y_step = 1 if self.data_entry & 0x02 else -1
+        if self.data_entry & 0x04:
+            self.y, wrapped = self._step(self.y, y_step, self.y_start, self.y_end)
+            if wrapped:
+                self.x, _ = self._step(self.x, x_step, self.x_start, self.x_end)
+        else:
+            self.x, wrapped = self._step(self.x, x_step, self.x_start, self.x_end)
+            if wrapped:
+                self.y, _ = self._step(self.y, y_step, self.y_start, self.y_end)
+
+    @staticmethod
+    def _step(value, step, start, end):
+        low, high = min(start, end), max(start, end)
+        value += step
+        if value > high:
+            return low, True
+        if value < low:
+            return high, True
+        return value, False
+
+    def waveform(self):
+        """Classify the 0x22 update control value the driver sends."""
+        control = self.update_control
+        if not control & 0x04:
+            return 'load'           # No display step, e.g. 0xB1/0x91
+        if control & 0x08:
+            return 'partial'        # Display mode 2, e.g. 0xFF
+        if control & 0x30 == 0x30:
+            return 'full'           # Loads temperature and LUT, e.g. 0xF7
+        return 'fast'               # Keeps the loaded LUT, e.g. 0xC7
+
+    def _activate(self):
+        kind = self.waveform()
+        if kind != 'load':
+            for y in range(self.height):
+                start = y * RAM_X_BYTES
+                self.panel[y * self.linewidth:(y + 1) * self.linewidth] = \
+                    self.ram[0x24][start:start + self.linewidth]
+            if kind == 'partial':
+                # Display mode 2 keeps the new image as the next reference
+                self.ram[0x26][:] = self.ram[0x24]
+            self.updates.append(kind)
+        return WAVEFORM_MS[kind]
+
+    def image(self):
+        """The emulated panel contents as a mode '1' PIL image (native portrait)."""
+        from PIL import Image
+        return Image.frombytes('1', (self.width, self.height), bytes(self.panel))
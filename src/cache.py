@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+try:
+    from src.fileutil import write_atomic
+except ImportError:
+    from fileutil import write_atomic
+
+logger = logging.getLogger(__name__)
+
+
+def default_cache_dir():
+    """Cache directory, overridable with EINK_WEATHER_CACHE_DIR."""
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.environ.get('EINK_WEATHER_CACHE_DIR', os.path.join(cache_home, 'eink_weather'))
+
+
+class CacheEntry:
+    __slots__ = ('data', 'fetched_at', 'weather')
+
+    def __init__(self, data, fetched_at):
+        self.data = data
+        self.fetched_at = fetched_at
+        # Normalized form of data, set by the first reader that needs it
+        self.weather = None
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+class ResponseCache:
+    """On-disk cache of raw API responses with a TTL and a stale window.
+
+    Entries younger than ttl are fresh. Entries older than ttl but younger
+    than ttl + stale_ttl may still be served while a refresh happens in the
+    background. Every entry is also kept in memory so repeated lookups do not
+    touch the disk, and files are replaced atomically so a crash never leaves
+    a truncated entry behind.
+    """
+
+    def __init__(self, cache_dir=None, ttl=15 * 60, stale_ttl=6 * 60 * 60):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory for cache files, None for default_cache_dir()
+            ttl: Seconds an entry is considered fresh
+            stale_ttl: Extra seconds a stale entry may be served while revalidating
+        """
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._memory = {}
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"Response cache disabled on disk ({e})")
+            self.cache_dir = None
+
+    @staticmethod
+    def make_key(lat, lon, params):
+        """Build a cache key from rounded coordinates and the query fields.
+
+        Args:
+            lat, lon: Coordinates, already rounded by the caller
+            params: Query parameters other than latitude/longitude
+        """
+        fields = '&'.join(f"{name}={params[name]}" for name in sorted(params))
+        raw = f"{lat:.2f},{lon:.2f}?{fields}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Return the CacheEntry for key, or None if there is none."""
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is not None or self.cache_dir is None:
+            return entry
+        try:
+            with open(self._path(key), 'r') as f:
+                stored = json.load(f)
+            entry = CacheEntry(stored['data'], stored['fetched_at'])
+        except (OSError, ValueError, KeyError):
+            return None
+        with self._lock:
+            self._memory[key] = entry
+        return entry
+
+    def put(self, key, data, fetched_at=None):
+        """Store a raw response under key."""
+        entry = CacheEntry(data, fetched_at if fetched_at is not None else time.time())
+        with self._lock:
+            self._memory[key] = entry
+        if self.cache_dir is None:
+            return entry
+        try:
+            write_atomic(self._path(key), json.dumps({'fetched_at': entry.fetched_at, 'data': data}))
+        except OSError as e:
+            logger.warning(f"Could not write cache entry ({e})")
+        return entry
+
+    def is_fresh(self, entry, ttl=None):
+        return entry.age < (self.ttl if ttl is None else ttl)
+
+    def is_usable_stale(self, entry):
+        return entry.age < self.ttl + self.stale_ttl
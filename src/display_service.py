@@ -1,168 +1,326 @@
 import os
 import sys
 import logging
-from PIL import Image, ImageDraw, ImageFont
-from datetime import datetime
+from PIL import ImageFont
 
 # Ensure lib is in path if running directly (for testing)
 if __name__ == "__main__":
     sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
 
+# Mock for testing on non-Pi systems or if driver fails to init
+class MockEPD:
+    width = 122
+    height = 250
+    def init(self): pass
+    def init_fast(self): pass
+    def Clear(self, color): pass
+    def display(self, image): pass
+    def display_fast(self, image): pass
+    def displayPartial(self, image): pass
+    def displayPartialWindow(self, image, previous, rows=None): return []
+    def displayPartBaseImage(self, image): pass
+    def writeBaseImage(self, image): pass
+    def displayFastBaseImage(self, image): pass
+    def getbuffer(self, image): return []
+    def sleep(self): pass
+
 try:
     from waveshare_epd import epd2in13_V4
 except (ImportError, RuntimeError, Exception) as e:
-    # Mock for testing on non-Pi systems or if driver fails to init
     print(f"Warning: waveshare_epd driver could not be loaded ({e}). Using mock.")
-    class MockEPD:
-        width = 122
-        height = 250
-        def init(self): pass
-        def Clear(self, color): pass
-        def display(self, image): pass
-        def getbuffer(self, image): return []
-        def sleep(self): pass
-    
+
     class MockModule:
         EPD = MockEPD
     
     epd2in13_V4 = MockModule()
 
 try:
-    from src.icons import IconDrawer
+    from src import metrics
+    from src.fonts import get_font
+    from src.framebuffer import FramePool, native_rows
+    from src.icons import IconAtlas
+    from src.refresh_policy import RefreshPolicy, RefreshMode
+    from src.snapshot import PanelState
+    from src.widgets import (WidgetLayout, CurrentIconWidget, TemperatureWidget,
+                             WindWidget, DividerWidget, ForecastDayWidget, SparklineWidget)
 except ImportError:
-    from icons import IconDrawer
+    import metrics
+    from fonts import get_font
+    from framebuffer import FramePool, native_rows
+    from icons import IconAtlas
+    from refresh_policy import RefreshPolicy, RefreshMode
+    from snapshot import PanelState
+    from widgets import (WidgetLayout, CurrentIconWidget, TemperatureWidget,
+                         WindWidget, DividerWidget, ForecastDayWidget, SparklineWidget)
+
+logger = logging.getLogger(__name__)
 
 class DisplayService:
-    def __init__(self):
-        self.epd = epd2in13_V4.EPD()
-        self.epd.init()
-        self.epd.Clear(0xFF)
+    # Current weather icon and forecast icon sizes
+    ICON_SIZE = 40
+    SMALL_ICON_SIZE = 25
+    # Width of the temperature trend right of the current temperature
+    SPARKLINE_WIDTH = 28
+
+    def __init__(self, refresh_policy=None, epd=None, snapshot=None, history=None):
+        """Initialize the service.
+
+        Args:
+            refresh_policy: RefreshPolicy to use, None for the defaults
+            epd: Panel driver that is already set up, e.g. MockEPD() to only
+                render frames; None to initialize and clear the Waveshare panel
+            snapshot: Snapshot the shown frame is saved to and restored from
+                at startup, None to always start from a cleared panel
+            history: HistoryStore of observed conditions to draw a
+                temperature sparkline from, None for the layout without one
+        """
+        self.snapshot = snapshot
+        self.history = history
+        if epd is not None:
+            self.epd = epd
+        else:
+            self.epd = epd2in13_V4.EPD()
+            try:
+                self.epd.init()
+            except (ImportError, RuntimeError) as e:
+                # The platform backend is only built on first use, so missing
+                # GPIO/SPI libraries show up here rather than at import
+                print(f"Warning: e-Paper backend could not be initialized ({e}). Using mock.")
+                self.epd = MockEPD()
+                self.epd.init()
+        # Let the driver time its SPI uploads and BUSY waits
+        self.epd.span = metrics.span
+        self.refresh_policy = refresh_policy or RefreshPolicy()
+        # Packed buffer currently shown on the panel, None forces a full refresh
+        self.last_buffer = None
+        # Canvas and packed buffers are allocated once and reused every frame
+        self.frame_pool = FramePool(self.epd.width, self.epd.height)
+        # Whether the canvas holds the last frame handed out for the panel,
+        # which widget damage boxes are relative to
+        self.canvas_is_last_frame = True
+        if epd is None and not self.restore():
+            self.epd.Clear(0xFF)
+        # Damage box of each rendered buffer, relative to the frame before it
+        self.frame_damage = {}
+        # Packed frame per location with the view it shows, so rotating back
+        # to a location costs an upload but no render
+        self.frames = {}
         # Use default font for simplicity
         self.font = ImageFont.load_default()
         # Try to load Montserrat fonts
         font_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts')
         try:
-            self.font_location = ImageFont.truetype(os.path.join(font_dir, "Montserrat-Bold.ttf"), 24)
-            self.font_temp = ImageFont.truetype(os.path.join(font_dir, "Montserrat-Bold.ttf"), 36)
-            self.font_detail = ImageFont.truetype(os.path.join(font_dir, "Montserrat-Regular.ttf"), 18)
-            self.font_forecast = ImageFont.truetype(os.path.join(font_dir, "Montserrat-Bold.ttf"), 22)
+            self.font_location = get_font(os.path.join(font_dir, "Montserrat-Bold.ttf"), 24)
+            self.font_temp = get_font(os.path.join(font_dir, "Montserrat-Bold.ttf"), 36)
+            self.font_detail = get_font(os.path.join(font_dir, "Montserrat-Regular.ttf"), 18)
+            self.font_forecast = get_font(os.path.join(font_dir, "Montserrat-Bold.ttf"), 22)
         except IOError:
             self.font_location = ImageFont.load_default()
             self.font_temp = ImageFont.load_default()
             self.font_detail = ImageFont.load_default()
             self.font_forecast = ImageFont.load_default()
 
-    def update_display(self, weather_data, location_name="Weather"):
-        if not weather_data:
-            return
-        
-        current = weather_data.get('current', {})
-        daily = weather_data.get('daily', {})
-        
-        if not current:
-            return
+        # Weather icons are pre-rendered once for the sizes used in the layout
+        self.icon_font_path = os.path.join(font_dir, 'weathericons-regular-webfont.ttf')
+        self.icon_atlas = IconAtlas(self.icon_font_path, sizes=(self.ICON_SIZE, self.SMALL_ICON_SIZE))
+        self.layout = self.build_layout()
 
-        # EPD_WIDTH = 122, EPD_HEIGHT = 250
-        # Landscape mode: 250x122
+    def build_layout(self):
+        """Split the landscape canvas (250x122) into independently cached widgets."""
         width = self.epd.height
         height = self.epd.width
-        
-        image = Image.new('1', (width, height), 255)
-        draw = ImageDraw.Draw(image)
-        
-        # --- Current Weather (Top Half) ---
-        # Icon
-        icon_size = 40
-        icon_x = 5
-        icon_y = 5
-        
-        # Initialize icon drawer with weather icons font
-        font_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts', 'weathericons-regular-webfont.ttf')
-        icon_drawer = IconDrawer(draw, font_path, icon_size)
-        
-        code = current.get('weathercode')
-        is_day = current.get('is_day', 1)
-        icon_drawer.draw_icon_for_code(code, icon_x, icon_y, icon_size, is_day)
-        
-        # Temp
-        temp_c = current.get('temperature')
-        temp_f = (temp_c * 9/5) + 32
-        temp_text = f"{temp_c}°C / {int(temp_f)}°F"
-        
-        # Use a slightly smaller font for temp to fit nicely
-        draw.text((65, 10), temp_text, font=self.font_location, fill=0)
-        
-        # Wind
-        wind_kmh = current.get('windspeed')
-        wind_mph = wind_kmh * 0.621371  # Convert km/h to mph
-        wind_dir = current.get('winddirection', 0)
-        def get_cardinal(d):
-            dirs = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
-            ix = round(d / (360. / len(dirs)))
-            return dirs[ix % len(dirs)]
-        wind_cardinal = get_cardinal(wind_dir)
-        draw.text((65, 40), f"W: {wind_kmh} km/h ({int(wind_mph)} mph) {wind_cardinal}", font=self.font_detail, fill=0)
-
-        # Divider between top and bottom
-        draw.line((0, 65, width, 65), fill=0, width=2)
-        
-        # --- Forecast (Bottom Half) ---
-        # We have daily data: time, weathercode, temperature_2m_max, temperature_2m_min
-        # We want to show today, tomorrow, day after (3 days)
-        
-        daily_time = daily.get('time', [])
-        daily_code = daily.get('weathercode', [])
-        daily_max = daily.get('temperature_2m_max', [])
-        daily_min = daily.get('temperature_2m_min', [])
-        
-        # Column width = width / 3
-        col_width = width // 3
-        
         # Skip today (index 0), show next 3 days (indices 1, 2, 3)
-        start_idx = 1
-        end_idx = min(start_idx + 3, len(daily_time))
-        
-        for i in range(start_idx, end_idx):
-            # Calculate display index (0, 1, 2) for positioning
-            display_i = i - start_idx
-            day_x = display_i * col_width
-            
-            # Date -> Day name
-            date_str = daily_time[i]
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-            day_name = date_obj.strftime('%a') # Mon, Tue...
-            
-            # Center text in column
-            # Day Name
-            bbox = draw.textbbox((0, 0), day_name, font=self.font_forecast)
-            w = bbox[2] - bbox[0]
-            draw.text((day_x + (col_width - w)//2, 70), day_name, font=self.font_forecast, fill=0)
-            
-            # Icon
-            small_icon_size = 25
-            # For forecast, assume daytime (is_day=1) since we don't have hourly data
-            icon_drawer.draw_icon_for_code(daily_code[i], day_x + (col_width - small_icon_size)//2, 90, small_icon_size, is_day=1)
-            
-            # Temp Range (Max/Min)
-            # e.g. 20/15
-            t_max = daily_max[i]
-            t_min = daily_min[i]
-            temp_range = f"{int(t_max)}/{int(t_min)}"
-            bbox = draw.textbbox((0, 0), temp_range, font=self.font_forecast)
-            w = bbox[2] - bbox[0]
-            draw.text((day_x + (col_width - w)//2, 125), temp_range, font=self.font_forecast, fill=0)
-
-
-        # Rotate image 180 degrees
-        image = image.rotate(180)
-        
-        self.epd.display(self.epd.getbuffer(image))
+        col_width = width // 3
+        forecast = [
+            ForecastDayWidget((i * col_width, 67, (i + 1) * col_width, height), i + 1,
+                              self.font_forecast, self.icon_font_path, self.SMALL_ICON_SIZE, self.icon_atlas)
+            for i in range(3)
+        ]
+        # --- Current Weather (Top Half) ---
+        # The temperature line leaves its right end free for the last 24
+        # hours of observed temperatures
+        temp_right = width if self.history is None else width - self.SPARKLINE_WIDTH
+        trend = [] if self.history is None else [SparklineWidget((temp_right, 0, width, 38), self.history)]
+        return WidgetLayout([
+            CurrentIconWidget((0, 0, 62, 64), self.icon_font_path, self.ICON_SIZE, self.icon_atlas),
+            # Use a slightly smaller font for temp to fit nicely
+            TemperatureWidget((62, 0, temp_right, 38), self.font_location),
+        ] + trend + [
+            WindWidget((62, 38, width, 64), self.font_detail),
+            DividerWidget((0, 64, width, 67)),
+            # --- Forecast (Bottom Half) ---
+        ] + forecast)
+
+    def restore(self):
+        """Bring back the frame saved before a restart instead of clearing.
+
+        If the panel still shows the saved frame, it is only loaded into the
+        controller RAM as the partial-refresh base, without any refresh.
+        If the panel was cleared since, the frame is shown with one full
+        refresh in place of the clear.
+
+        Returns:
+            True if a saved frame is on the panel now
+        """
+        if self.snapshot is None:
+            return False
+        saved = self.snapshot.load_frame(self.epd.width, self.epd.height)
+        if saved is None:
+            return False
+        buffer = self.frame_pool.acquire()
+        buffer[:] = saved.data
+        if saved.state == PanelState.SHOWN:
+            logger.info("Panel still shows the saved frame, skipping the clear")
+            self.epd.writeBaseImage(buffer)
+            self.refresh_policy.record(RefreshMode.PARTIAL)
+        else:
+            logger.info("Showing the saved frame")
+            self.epd.displayPartBaseImage(buffer)
+            self.refresh_policy.record(RefreshMode.FULL)
+            self.snapshot.save_frame(self.epd.width, self.epd.height, buffer)
+        self._show(buffer)
+        self.canvas_is_last_frame = False
+        return True
+
+    def update_display(self, weather_data, location_name="Weather"):
+        buffer = self.render_frame(weather_data, location_name)
+        if buffer is not None:
+            self.refresh(buffer)
+
+    def render_frame(self, weather_data, location_name="Weather"):
+        """Render weather data into a packed framebuffer without touching the panel.
+
+        A view of a location that was rendered before is copied from the
+        frame cache instead. The returned buffer stays reserved until it is
+        passed to refresh().
+
+        Returns:
+            Packed framebuffer, or None if there is nothing to draw
+        """
+        if not weather_data or weather_data.current is None:
+            return None
+
+        cached = self.frames.get(location_name)
+        if cached is not None and cached[0] == weather_data.version:
+            metrics.inc("frame_cache", result="hit")
+            buffer = self.frame_pool.acquire()
+            buffer[:] = cached[1]
+            # No damage box: the canvas still holds the frame rendered last
+            self.canvas_is_last_frame = False
+            return buffer
+
+        metrics.inc("frame_cache", result="miss")
+        buffer, damage = self._render(weather_data, location_name)
+        # Damage is only meaningful against the frame handed out before
+        self.frame_damage[id(buffer)] = damage if self.canvas_is_last_frame else None
+        self.canvas_is_last_frame = True
+        return buffer
+
+    def prerender(self, weather_data, location_name="Weather"):
+        """Render a location's frame into the frame cache without showing it."""
+        if not weather_data or weather_data.current is None or self.has_frame(weather_data, location_name):
+            return
+        buffer, _ = self._render(weather_data, location_name)
+        self.frame_pool.release(buffer)
+        self.canvas_is_last_frame = False
+
+    def has_frame(self, weather_data, location_name):
+        """Whether the frame cache holds the frame for this view of a location."""
+        cached = self.frames.get(location_name)
+        return cached is not None and cached[0] == weather_data.version
+
+    def _render(self, weather_data, location_name):
+        with metrics.span("render"):
+            damage = self.layout.render(self.frame_pool.canvas, weather_data, location_name)
+
+        # Rotate 180 degrees and pack into the panel's native layout in one pass
+        with metrics.span("pack"):
+            buffer = self.frame_pool.pack()
+        self.frames[location_name] = (weather_data.version, bytes(buffer))
+        return buffer, damage
+
+    def refresh(self, buffer):
+        """Push a packed framebuffer to the panel with the cheapest safe waveform.
+
+        The buffer is kept as the partial-refresh base, so the caller must not
+        modify it afterwards.
+
+        Args:
+            buffer: Packed framebuffer as returned by epd.getbuffer()
+
+        Returns:
+            The RefreshMode that was used
+        """
+        damage = self.frame_damage.pop(id(buffer), None)
+        try:
+            return self._refresh(buffer, damage)
+        finally:
+            # A no-op if the buffer is now the shown one
+            self.frame_pool.release(buffer)
+
+    def _refresh(self, buffer, damage=None):
+        mode = self.refresh_policy.decide(self.last_buffer, buffer)
+        logger.info(f"Refresh mode: {mode}")
+        metrics.inc("refreshes", mode=mode)
+        if mode == RefreshMode.SKIP:
+            return mode
+
+        try:
+            if mode == RefreshMode.FULL:
+                self.epd.init()
+                self.epd.displayPartBaseImage(buffer)
+            elif mode == RefreshMode.FAST:
+                self.epd.init_fast()
+                self.epd.displayFastBaseImage(buffer)
+            else:
+                # Widgets only changed inside the damage box, so only those
+                # panel rows need to be compared
+                rows = native_rows(damage) if damage is not None else None
+                bands = self.epd.displayPartialWindow(buffer, self.last_buffer, rows)
+                logger.debug(f"Partial refresh uploaded bands: {bands}")
+        except Exception as e:
+            # Panel contents are unknown now, the next frame gets a full refresh
+            metrics.inc("refresh_failures", mode=mode, error=type(e).__name__)
+            self._show(None)
+            if self.snapshot is not None:
+                self.snapshot.mark_cleared()
+            raise
+
+        busy_ms = getattr(self.epd, 'last_busy_ms', None)
+        if busy_ms is not None:
+            logger.info(f"{mode} refresh waveform took {busy_ms:.0f} ms")
+
+        self.refresh_policy.record(mode)
+        self._show(buffer)
+        if self.snapshot is not None:
+            self.snapshot.save_frame(self.epd.width, self.epd.height, buffer)
+        return mode
+
+    def _show(self, buffer):
+        """Make buffer the partial-refresh base; the pool keeps it reserved until replaced."""
+        self.frame_pool.show(buffer)
+        self.last_buffer = buffer
+
+    def sleep(self):
+        """Deep-sleep the panel; the frame stays on the glass and in the snapshot."""
+        self.epd.sleep()
+        self._show(None)
+        self.refresh_policy.reset()
 
     def clear(self):
+        # Partial refreshes leave the controller in partial mode, re-init first
+        self.epd.init()
         self.epd.Clear(0xFF)
         self.epd.sleep()
+        self._show(None)
+        self.refresh_policy.reset()
+        if self.snapshot is not None:
+            self.snapshot.mark_cleared()
 
 if __name__ == "__main__":
+    from models import CurrentConditions, WeatherData
     ds = DisplayService()
     # Test data
-    ds.update_display({'temperature': 20, 'windspeed': 10, 'weathercode': 1})
+    ds.update_display(WeatherData(current=CurrentConditions(
+        temperature=20, apparent_temperature=20, windspeed=10, winddirection=0,
+        weathercode=1, is_day=1, time=None, interval=None)))
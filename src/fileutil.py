@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+
+def write_atomic(path, data, fsync=False, mode=None):
+    """Replace a file in one step, so readers never see half of it.
+
+    The data goes to a temporary file in the same directory, which is
+    renamed over path; on any failure the temporary file is removed.
+
+    Args:
+        path: File to replace
+        data: str or bytes to write
+        fsync: Flush the data to disk before the rename, so the file
+            survives a power cut
+        mode: Permission bits for the file, None for mkstemp's 0o600
+
+    Raises:
+        OSError: If the file could not be written
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, (bytes, bytearray, memoryview)) else 'w') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+from PIL import ImageFont
+
+
+class FontRegistry:
+    """Process-wide cache of loaded TrueType fonts.
+
+    Parsing a TTF is far more expensive than drawing with it, so fonts are
+    loaded once per (path, size) and shared by every renderer. The least
+    recently used fonts are evicted once the registry is full.
+    """
+
+    def __init__(self, max_fonts=32):
+        """Initialize the registry.
+
+        Args:
+            max_fonts: Number of (path, size) fonts kept loaded
+        """
+        self.max_fonts = max_fonts
+        self._fonts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, size):
+        """Return the font at path with the given size, loading it if needed.
+
+        Args:
+            path: Path to a .ttf file
+            size: Font size in pixels
+
+        Raises:
+            IOError: If the font file cannot be loaded
+        """
+        key = (path, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                return font
+
+        font = ImageFont.truetype(path, size)
+        with self._lock:
+            self._fonts[key] = font
+            self._fonts.move_to_end(key)
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+        return font
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+
+
+_registry = FontRegistry()
+
+
+def get_font(path, size):
+    """Load a font through the shared process-wide registry."""
+    return _registry.get(path, size)
@@ -0,0 +1,224 @@
+import io
+import os
+import sys
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from PIL import Image
+
+# Add lib to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+
+try:
+    from src import metrics, playback
+    from src.display_service import DisplayService, MockEPD
+    from src.history import slugify
+    from src.main import LOCATIONS
+    from src.scheduler import HOURLY, DAILY, expires_at
+    from src.weather_service import WeatherService
+except ImportError:
+    import metrics
+    import playback
+    from display_service import DisplayService, MockEPD
+    from history import slugify
+    from main import LOCATIONS
+    from scheduler import HOURLY, DAILY, expires_at
+    from weather_service import WeatherService
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a location whose data could not be fetched is tried again
+RETRY_SECONDS = 60
+
+
+class Frame:
+    __slots__ = ('data', 'etag', 'valid_until', 'png')
+
+    def __init__(self, data, etag, valid_until):
+        self.data = data
+        self.etag = etag
+        self.valid_until = valid_until
+        self.png = None
+
+
+class FrameServer:
+    """Renders packed frames per location for clients without a renderer.
+
+    A frame is the panel-ready buffer DisplayService would upload, the same
+    bytes EPD.getbuffer returns. Each location's frame is cached until its
+    weather data expires or the hourly playback moves to the next step, so
+    polling clients are answered from memory. Concurrent requests for a
+    location that needs a new frame wait for a single fetch and render.
+    """
+
+    def __init__(self, locations, weather_service=None, renderer=None):
+        """Initialize the server.
+
+        Args:
+            locations: List of dicts with "name", "lat" and "lon" keys
+            weather_service: WeatherService to use, None for a default one
+            renderer: DisplayService to render with, None for one without a panel
+        """
+        self.locations = {slugify(location["name"]): location for location in locations}
+        self.weather_service = weather_service or WeatherService()
+        self.renderer = renderer or DisplayService(epd=MockEPD())
+        self._frames = {}
+        self._locks = {key: threading.Lock() for key in self.locations}
+        # The renderer draws on one shared canvas
+        self._render_lock = threading.Lock()
+
+    def resolve(self, name):
+        """Location key for a slug or a location name, None if unknown."""
+        if name is None:
+            return next(iter(self.locations)) if len(self.locations) == 1 else None
+        key = slugify(name)
+        return key if key in self.locations else None
+
+    def get_frame(self, key):
+        """Current Frame of a location, or None if there is no data at all."""
+        frame = self._frames.get(key)
+        if frame is not None and frame.valid_until > time.time():
+            return frame
+        # Single flight: one request renders, the others wait and reuse it
+        with self._locks[key]:
+            frame = self._frames.get(key)
+            now = time.time()
+            if frame is not None and frame.valid_until > now:
+                return frame
+            new_frame = self._render(key, now)
+            if new_frame is None:
+                if frame is not None:
+                    # Keep serving the last frame and retry soon
+                    frame.valid_until = now + RETRY_SECONDS
+                return frame
+            self._frames[key] = new_frame
+        metrics.flush("frame")
+        return new_frame
+
+    def _render(self, key, now):
+        location = self.locations[key]
+        parts = (HOURLY, DAILY)
+        weather = self.weather_service.get_weather_batch([location], parts)[0]
+        view = playback.view(weather, now)
+        if not view or view.current is None:
+            logger.error(f"No weather data for {location['name']}")
+            return None
+
+        with self._render_lock, metrics.span("server_render"):
+            buffer = self.renderer.render_frame(view, location["name"])
+            try:
+                data = bytes(buffer)
+            finally:
+                self.renderer.frame_damage.pop(id(buffer), None)
+                self.renderer.frame_pool.release(buffer)
+
+        fetched_at = weather.fetched_at or now
+        expiries = [expires_at(weather, part, fetched_at) for part in parts]
+        valid_until = min([playback.next_step(now)] + [e for e in expiries if e is not None and e > now])
+        etag = '"' + hashlib.sha1(data).hexdigest()[:16] + '"'
+        return Frame(data, etag, valid_until)
+
+    def preview(self, frame):
+        """PNG of a frame in landscape, as it appears on the panel."""
+        if frame.png is None:
+            epd = self.renderer.epd
+            native = Image.frombytes('1', (epd.width, epd.height), frame.data)
+            out = io.BytesIO()
+            native.transpose(Image.ROTATE_90).save(out, format='PNG', optimize=True)
+            frame.png = out.getvalue()
+        return frame.png
+
+
+class FrameRequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so polling clients do not reconnect for every request
+    protocol_version = "HTTP/1.1"
+    server_version = "EinkFrameServer/1.0"
+    # Headers and body are separate writes; with Nagle on, every keep-alive
+    # response would stall on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path not in ("/frame", "/frame.png"):
+            return self.send_empty(404)
+        query = parse_qs(url.query)
+        frame_server = self.server.frame_server
+        key = frame_server.resolve(query.get("location", [None])[0])
+        if key is None:
+            return self.send_empty(404)
+
+        frame = frame_server.get_frame(key)
+        if frame is None:
+            return self.send_empty(503, {"Retry-After": str(RETRY_SECONDS)})
+
+        png = url.path == "/frame.png"
+        etag = frame.etag[:-1] + '-png"' if png else frame.etag
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"max-age={max(0, int(frame.valid_until - time.time()))}",
+        }
+        if etag in self.if_none_match():
+            metrics.inc("frame_requests", status=304)
+            return self.send_empty(304, headers)
+
+        body = frame_server.preview(frame) if png else frame.data
+        epd = frame_server.renderer.epd
+        headers["Content-Type"] = "image/png" if png else "application/octet-stream"
+        headers["X-Frame-Size"] = f"{epd.width}x{epd.height}"
+        metrics.inc("frame_requests", status=200)
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def if_none_match(self):
+        header = self.headers.get("If-None-Match", "")
+        tags = (tag.strip() for tag in header.split(","))
+        return {tag[2:] if tag.startswith("W/") else tag for tag in tags if tag}
+
+    def send_empty(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # Hundreds of polling clients would flood the default stderr log
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class FrameHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, frame_server):
+        super().__init__(address, FrameRequestHandler)
+        self.frame_server = frame_server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve packed e-ink frames over HTTP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+
+    httpd = FrameHTTPServer((args.host, args.port), FrameServer(LOCATIONS))
+    logger.info(f"Serving frames for {', '.join(httpd.frame_server.locations)} on {args.host}:{args.port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
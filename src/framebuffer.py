@@ -0,0 +1,112 @@
+import threading
+from PIL import Image, ImageDraw
+
+
+def packed_size(width, height):
+    """Size in bytes of a packed 1-bit buffer, rows padded to whole bytes."""
+    return ((width + 7) // 8) * height
+
+
+def pack_into(image, out):
+    """Pack a landscape frame into the panel's native MSB-first layout.
+
+    The layout is drawn as a 250x122 landscape image and the panel is mounted
+    upside down, which used to mean rotate(180), then rotate(90, expand=True)
+    and convert('1') in EPD.getbuffer, then a bytearray copy. Those steps are
+    a single 270 degree transpose, so this does one transpose and writes the
+    packed rows straight into a reusable buffer.
+
+    Args:
+        image: Mode '1' landscape image, EPD height wide and EPD width tall
+        out: bytearray of packed_size(EPD width, EPD height) bytes
+
+    Returns:
+        out, filled with the same bytes EPD.getbuffer(image.rotate(180)) returns
+    """
+    if image.mode != '1':
+        image = image.convert('1')
+    native = image.transpose(Image.ROTATE_270)
+    memoryview(out)[:] = native.tobytes()
+    return out
+
+
+def native_rows(box):
+    """Panel rows covered by a landscape canvas box, as packed by pack_into.
+
+    The 270 degree transpose maps landscape column x to native row x.
+
+    Args:
+        box: (left, top, right, bottom) in landscape pixels, right exclusive
+
+    Returns:
+        (first_row, last_row), inclusive
+    """
+    return box[0], box[2] - 1
+
+
+class FramePool:
+    """Preallocated drawing canvas and packed buffers reused for every frame.
+
+    A long-running display renders the same size frame every cycle, so the
+    landscape canvas, its ImageDraw and the packed buffers are allocated once
+    and cleared or overwritten in place. A packed buffer handed out by pack()
+    stays reserved until release(), and the buffer passed to show() stays
+    reserved until another one replaces it, so a frame rendered ahead can
+    overwrite neither.
+    """
+
+    def __init__(self, epd_width, epd_height, buffers=4):
+        """Initialize the pool.
+
+        Args:
+            epd_width, epd_height: Native panel size, e.g. 122x250
+            buffers: Packed buffers in the pool; one is shown, one may be
+                uploading, one may wait for the panel and one rendered ahead
+        """
+        self.size = (epd_height, epd_width)
+        self.canvas = Image.new('1', self.size, 255)
+        self.draw = ImageDraw.Draw(self.canvas)
+        self.buffers = [bytearray(packed_size(epd_width, epd_height)) for _ in range(buffers)]
+        self._reserved = set()
+        self.shown = None
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Blank the canvas in place and return it with its ImageDraw."""
+        self.canvas.paste(255, (0, 0) + self.size)
+        return self.canvas, self.draw
+
+    def acquire(self):
+        """Reserve a packed buffer that is not reserved."""
+        with self._lock:
+            for buffer in self.buffers:
+                if id(buffer) not in self._reserved:
+                    self._reserved.add(id(buffer))
+                    return buffer
+        raise RuntimeError("No free frame buffer, too many frames rendered ahead of the panel")
+
+    def release(self, buffer):
+        """Give a reserved buffer back, unless it is the shown one."""
+        with self._lock:
+            if buffer is not self.shown:
+                self._reserved.discard(id(buffer))
+
+    def show(self, buffer):
+        """Mark buffer as the one on the panel, keeping it reserved.
+
+        The previously shown buffer is released in the same step, so no
+        frame rendered ahead can be packed into either of them in between.
+
+        Args:
+            buffer: Buffer now on the panel, or None if nothing known is
+        """
+        with self._lock:
+            if self.shown is not None and self.shown is not buffer:
+                self._reserved.discard(id(self.shown))
+            self.shown = buffer
+            if buffer is not None:
+                self._reserved.add(id(buffer))
+
+    def pack(self):
+        """Pack the canvas into a reserved buffer, see pack_into."""
+        return pack_into(self.canvas, self.acquire())
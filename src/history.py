@@ -0,0 +1,193 @@
+import os
+import re
+import math
+import mmap
+import struct
+import logging
+import threading
+from array import array
+
+try:
+    from src.models import MISSING_CODE
+    from src.snapshot import default_state_dir
+except ImportError:
+    from models import MISSING_CODE
+    from snapshot import default_state_dir
+
+logger = logging.getLogger(__name__)
+
+# magic, record size, capacity, records appended so far
+HISTORY_HEADER = struct.Struct('<8sIIQ')
+HISTORY_MAGIC = b'EINKHST1'
+# timestamp, temperature, windspeed, weather code
+HISTORY_RECORD = struct.Struct('<dffh2x')
+_TIMESTAMP = struct.Struct('<d')
+
+# One week of 15-minute current-conditions readings per location
+HISTORY_CAPACITY = 7 * 24 * 4
+
+
+def slugify(name):
+    """URL- and file-friendly location key, e.g. "Birmingham, AL" -> "birmingham-al"."""
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+class HistoryWindow:
+    """Records of one location in a time range, oldest first, as columns."""
+    __slots__ = ('times', 'temperature', 'windspeed', 'weathercode')
+
+    def __init__(self):
+        self.times = array('d')
+        self.temperature = array('f')
+        self.windspeed = array('f')
+        self.weathercode = array('h')
+
+    def __len__(self):
+        return len(self.times)
+
+
+class HistoryRing:
+    """Fixed-size ring of fixed-width records in one memory-mapped file.
+
+    The file is a header followed by capacity records. Appending writes one
+    record in place and bumps the count in the header, so it costs the same
+    however long the history is, and reads only unpack the records asked for.
+    """
+
+    def __init__(self, path, capacity=HISTORY_CAPACITY):
+        self.capacity = capacity
+        size = HISTORY_HEADER.size + capacity * HISTORY_RECORD.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            existing = os.fstat(fd).st_size
+            if existing != size:
+                if existing:
+                    logger.warning(f"Resetting history {path} (size {existing}, expected {size})")
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        magic, record_size, stored_capacity, count = HISTORY_HEADER.unpack_from(self._map)
+        if (magic, record_size, stored_capacity) != (HISTORY_MAGIC, HISTORY_RECORD.size, capacity):
+            if magic != bytes(len(magic)):
+                logger.warning(f"Resetting history {path} (unknown format)")
+            count = 0
+            self._write_header(count)
+        self.count = count
+
+    def _write_header(self, count):
+        HISTORY_HEADER.pack_into(self._map, 0, HISTORY_MAGIC, HISTORY_RECORD.size, self.capacity, count)
+
+    def _offset(self, index):
+        return HISTORY_HEADER.size + (index % self.capacity) * HISTORY_RECORD.size
+
+    def _timestamp(self, index):
+        return _TIMESTAMP.unpack_from(self._map, self._offset(index))[0]
+
+    def append(self, timestamp, temperature, windspeed, weathercode):
+        """Add a record unless it is not newer than the last one.
+
+        Returns:
+            True if the record was added
+        """
+        if self.count and timestamp <= self._timestamp(self.count - 1):
+            return False
+        HISTORY_RECORD.pack_into(
+            self._map, self._offset(self.count), timestamp,
+            math.nan if temperature is None else temperature,
+            math.nan if windspeed is None else windspeed,
+            MISSING_CODE if weathercode is None else weathercode)
+        # The count goes last, a torn append leaves the previous history
+        self.count += 1
+        self._write_header(self.count)
+        self._map.flush()
+        return True
+
+    def window(self, since):
+        """HistoryWindow of the records with timestamps from since on."""
+        # Records are in time order, so the first one is found by bisection
+        lo, hi = max(0, self.count - self.capacity), self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamp(mid) < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        result = HistoryWindow()
+        while lo < self.count:
+            # Up to the end of the file, then again from its start
+            stop = min(self.count, lo - lo % self.capacity + self.capacity)
+            start_offset = self._offset(lo)
+            chunk = self._map[start_offset:start_offset + (stop - lo) * HISTORY_RECORD.size]
+            for timestamp, temperature, windspeed, code in HISTORY_RECORD.iter_unpack(chunk):
+                result.times.append(timestamp)
+                result.temperature.append(temperature)
+                result.windspeed.append(windspeed)
+                result.weathercode.append(code)
+            lo = stop
+        return result
+
+    def close(self):
+        self._map.close()
+
+
+class HistoryStore:
+    """Observed current conditions per location, kept across restarts for trend widgets."""
+
+    def __init__(self, state_dir=None, capacity=HISTORY_CAPACITY):
+        """Initialize the store.
+
+        Args:
+            state_dir: Directory for the ring files, None for default_state_dir()
+            capacity: Records kept per location
+        """
+        self.state_dir = state_dir or default_state_dir()
+        self.capacity = capacity
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"History disabled ({e})")
+            self.state_dir = None
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def _ring(self, name):
+        key = slugify(name)
+        ring = self._rings.get(key)
+        if ring is None and self.state_dir is not None:
+            try:
+                ring = HistoryRing(os.path.join(self.state_dir, f'history-{key}.bin'), self.capacity)
+            except (OSError, ValueError) as e:
+                logger.warning(f"History for {name} disabled ({e})")
+                self.state_dir = None
+                return None
+            self._rings[key] = ring
+        return ring
+
+    def append(self, name, conditions):
+        """Record a location's CurrentConditions, once per timestamp.
+
+        Returns:
+            True if a record was added
+        """
+        if conditions is None or conditions.time is None:
+            return False
+        with self._lock:
+            ring = self._ring(name)
+            if ring is None:
+                return False
+            return ring.append(conditions.time, conditions.temperature,
+                               conditions.windspeed, conditions.weathercode)
+
+    def window(self, name, since):
+        """HistoryWindow of a location from since on, empty if there is none."""
+        with self._lock:
+            ring = self._ring(name)
+            return ring.window(since) if ring is not None else HistoryWindow()
+
+    def close(self):
+        with self._lock:
+            for ring in self._rings.values():
+                ring.close()
+            self._rings.clear()
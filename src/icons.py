@@ -1,4 +1,12 @@
-from PIL import ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    from src.fonts import get_font
+except ImportError:
+    from fonts import get_font
+
+# Icon drawn for codes missing from the mapping (cloudy)
+DEFAULT_ICON = '\uf013'
 
 class IconDrawer:
     """Weather icon renderer using weather-icons font."""
@@ -55,17 +63,19 @@ class IconDrawer:
         99: {'day': '\uf010', 'night': '\uf010'},  # thunderstorm / thunderstorm (with hail)
     }
     
-    def __init__(self, draw: ImageDraw.ImageDraw, font_path: str, font_size: int = 35):
+    def __init__(self, draw: ImageDraw.ImageDraw, font_path: str, font_size: int = 35, atlas=None):
         """Initialize the icon drawer with weather-icons font.
         
         Args:
             draw: PIL ImageDraw object
             font_path: Path to weathericons-regular-webfont.ttf
             font_size: Size of the weather icon font
+            atlas: Optional IconAtlas with pre-rendered icons
         """
         self.draw = draw
+        self.atlas = atlas
         try:
-            self.icon_font = ImageFont.truetype(font_path, font_size)
+            self.icon_font = get_font(font_path, font_size)
         except IOError:
             # Fallback to default font if weather icons font not found
             print(f"Warning: Could not load weather icons font from {font_path}")
@@ -87,7 +97,7 @@ class IconDrawer:
             return self.WMO_TO_ICON[code][time_of_day]
         else:
             # Default to cloudy icon
-            return '\uf013'
+            return DEFAULT_ICON
     
     def draw_icon_for_code(self, code, x, y, size, is_day=1):
         """Draw weather icon for the given WMO code.
@@ -100,12 +110,64 @@ class IconDrawer:
         """
         # Get the icon character
         icon_char = self.get_icon_char(code, is_day)
+
+        # Paste the pre-rendered bitmap when the atlas has this size
+        if self.atlas is not None:
+            glyph = self.atlas.get(icon_char, size)
+            if glyph is not None:
+                offset_x, offset_y, bitmap = glyph
+                self.draw.bitmap((x + offset_x, y + offset_y), bitmap, fill=0)
+                return
         
         # Create font with the requested size
         try:
-            sized_font = ImageFont.truetype(self.icon_font.path, size)
+            sized_font = get_font(self.icon_font.path, size)
         except (AttributeError, IOError):
             sized_font = self.icon_font
         
         # Draw the icon
         self.draw.text((x, y), icon_char, font=sized_font, fill=0)
+
+
+class IconAtlas:
+    """Pre-rasterized 1-bit bitmaps of every weather icon.
+
+    Rendering a glyph through FreeType on every frame is wasted work since
+    the set of icons and sizes is fixed, so each one is rendered once and
+    later drawn as a bitmap.
+    """
+
+    def __init__(self, font_path: str, sizes=(40, 25)):
+        """Render every icon in WMO_TO_ICON at each of the given sizes.
+
+        Args:
+            font_path: Path to weathericons-regular-webfont.ttf
+            sizes: Icon sizes to pre-render
+        """
+        self.glyphs = {}
+        chars = {DEFAULT_ICON}
+        for icons in IconDrawer.WMO_TO_ICON.values():
+            chars.update(icons.values())
+
+        for size in sizes:
+            try:
+                font = get_font(font_path, size)
+            except IOError:
+                print(f"Warning: Could not load weather icons font from {font_path}")
+                continue
+            for char in chars:
+                self.glyphs[(char, size)] = self._render(font, char)
+
+    @staticmethod
+    def _render(font, char):
+        left, top, right, bottom = font.getbbox(char)
+        bitmap = Image.new('1', (max(right - left, 1), max(bottom - top, 1)), 0)
+        ImageDraw.Draw(bitmap).text((-left, -top), char, font=font, fill=1)
+        return left, top, bitmap
+
+    def get(self, char, size):
+        """Return (offset_x, offset_y, bitmap) for the icon, or None.
+
+        The offsets are relative to the position draw.text() would use.
+        """
+        return self.glyphs.get((char, size))
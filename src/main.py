@@ -1,58 +1,291 @@
+import time
+_STARTED = time.monotonic()
+
 import sys
 import os
-import time
+import signal
+import asyncio
 import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 # Add lib to path
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
 
 try:
+    from src import metrics, playback
+    from src.history import HistoryStore
+    from src.models import WeatherData
+    from src.scheduler import FetchScheduler, HOURLY, DAILY, expires_at
+    from src.snapshot import Snapshot
     from src.weather_service import WeatherService
     from src.display_service import DisplayService
 except ImportError:
+    import metrics
+    import playback
+    from history import HistoryStore
+    from models import WeatherData
+    from scheduler import FetchScheduler, HOURLY, DAILY, expires_at
+    from snapshot import Snapshot
     from weather_service import WeatherService
     from display_service import DisplayService
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def main():
-    logger.info("Starting Weather Display...")
-    weather_service = WeatherService()
-    display_service = DisplayService()
+_IMPORTED = time.monotonic()
+
+# Seconds each location stays on the panel before moving to the next one.
+# Rotation shows frames rendered ahead from cached data, so a step costs
+# one panel upload and no HTTP request or render
+CYCLE_SECONDS = 5 * 60
+
+# Blank the panel on exit; otherwise the last frame stays on the glass and
+# is picked up again without a refresh on the next start
+CLEAR_ON_EXIT = False
+
+LOCATIONS = [
+    {"name": "Birmingham, AL", "lat": 33.5186, "lon": -86.8104},
+    #{"name": "Calicut, Kerala", "lat": 11.2588, "lon": 75.7804}
+]
+
+
+class WeatherDisplayApp:
+    """Runs fetching, rendering and panel I/O as separate asyncio stages.
+
+    Blocking work never runs on the event loop: HTTP requests and rendering
+    use a small worker pool, and all SPI/GPIO traffic goes through a single
+    panel thread so the driver is never entered concurrently. Stages are
+    connected by queues of size one, so the next frame is rendered while the
+    panel is still busy with the current waveform.
+    """
+
+    def __init__(self, locations, cycle_seconds=CYCLE_SECONDS, clear_on_exit=CLEAR_ON_EXIT):
+        self.locations = locations
+        self.cycle_seconds = cycle_seconds
+        self.clear_on_exit = clear_on_exit
+        self.weather_service = WeatherService()
+        # Last frame and last good weather, so a restart shows data at once
+        self.snapshot = Snapshot()
+        # Fetched current conditions per location, for the trend sparkline
+        self.history = HistoryStore()
+        # Current conditions are played back from the hourly series, so
+        # only the hourly and daily parts are fetched, every few hours
+        self.scheduler = FetchScheduler(parts=(HOURLY, DAILY))
+        # Latest merged weather per location, parts arrive on separate cadences
+        self.weather = [None] * len(locations)
+        self.display_service = None
+        self.stop_event = None
+        self.work_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="work")
+        self.panel_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="panel")
+        # Monotonic timestamps for the startup report
+        self.startup = {"started": _STARTED, "imported": _IMPORTED}
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop_event.set)
+
+        self.startup["panel_init_started"] = time.monotonic()
+        self.display_service = await loop.run_in_executor(
+            self.panel_executor, functools.partial(DisplayService, snapshot=self.snapshot, history=self.history))
+        self.startup["panel_ready"] = time.monotonic()
+        self.restore_weather()
+
+        render_queue = asyncio.Queue(maxsize=1)
+        panel_queue = asyncio.Queue(maxsize=1)
+        stages = [
+            asyncio.ensure_future(self.fetch_stage(render_queue)),
+            asyncio.ensure_future(self.render_stage(render_queue, panel_queue)),
+            asyncio.ensure_future(self.panel_stage(panel_queue)),
+        ]
+        stop_waiter = asyncio.ensure_future(self.stop_event.wait())
+        try:
+            done, _ = await asyncio.wait(stages + [stop_waiter], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not stop_waiter and task.exception() is not None:
+                    logger.error("An error occurred", exc_info=task.exception())
+        finally:
+            logger.info("Exiting...")
+            for task in stages + [stop_waiter]:
+                task.cancel()
+            await asyncio.gather(*stages, stop_waiter, return_exceptions=True)
+            await self.shutdown()
+
+    async def shutdown(self):
+        """Deep-sleep the panel (clearing it first if configured), then stop the worker threads."""
+        loop = asyncio.get_running_loop()
+        if self.display_service is not None:
+            # Runs after any in-flight refresh since the panel thread is serial
+            action = self.display_service.clear if self.clear_on_exit else self.display_service.sleep
+            try:
+                await loop.run_in_executor(self.panel_executor, action)
+            except Exception as e:
+                logger.error(f"Failed to put display to sleep: {e}", exc_info=True)
+        self.panel_executor.shutdown(wait=True)
+        self.work_executor.shutdown(wait=False)
+
+    async def sleep(self, seconds):
+        """Sleep that ends early when shutdown is requested."""
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
 
-    locations = [
-        {"name": "Birmingham, AL", "lat": 33.5186, "lon": -86.8104},
-        #{"name": "Calicut, Kerala", "lat": 11.2588, "lon": 75.7804}
-    ]
-    current_location_index = 0
+    async def fetch_stage(self, render_queue):
+        """Fetch each forecast part when it expires upstream and rotate locations.
 
-    try:
+        The hourly series is fetched every few hours and played back locally
+        in 15-minute steps, and the daily block is also fetched at local
+        midnight so forecast day names roll over on time. A frame is
+        rendered when what the shown location should display changes or the
+        rotation moves on.
+        """
+        loop = asyncio.get_running_loop()
+        current_location_index = 0
+        next_rotation = time.time() + self.cycle_seconds
+        shown = None
+        while not self.stop_event.is_set():
+            now = time.time()
+            if len(self.locations) > 1 and now >= next_rotation:
+                current_location_index = (current_location_index + 1) % len(self.locations)
+                next_rotation = now + self.cycle_seconds
+
+            # Data restored from the snapshot is shown before the first fetch
+            shown = await self.show(render_queue, current_location_index, now, shown)
+            parts = self.scheduler.due(now)
+            if parts:
+                await self.fetch_parts(loop, parts, now)
+                await loop.run_in_executor(self.work_executor, self.record_history)
+                shown = await self.show(render_queue, current_location_index, time.time(), shown)
+            await self.prerender(render_queue, current_location_index, now)
+
+            wake = min(self.scheduler.next_wake(), playback.next_step(now))
+            if len(self.locations) > 1:
+                wake = min(wake, next_rotation)
+            delay = max(1.0, wake - time.time())
+            logger.info(f"Next update in {delay / 60:.1f} minutes")
+            await self.sleep(delay)
+
+    async def show(self, render_queue, index, now, shown):
+        """Queue a frame if what a location should display has changed.
+
+        Returns:
+            The (location, weather) now queued or shown
+        """
+        location = self.locations[index]
+        weather = playback.view(self.weather[index], now)
+        if weather and weather.current is not None and (location, weather) != shown:
+            logger.info(f"Weather for {location['name']}: {weather.current}")
+            await render_queue.put((location, weather, True))
+            return (location, weather)
+        return shown
+
+    async def prerender(self, render_queue, index, now):
+        """Queue frames of the other locations so their turn needs no render."""
+        if len(self.locations) < 2:
+            return
+        for other, location in enumerate(self.locations):
+            weather = playback.view(self.weather[other], now)
+            if other == index or not weather or weather.current is None:
+                continue
+            if not self.display_service.has_frame(weather, location["name"]):
+                await render_queue.put((location, weather, False))
+
+    def record_history(self):
+        """Append each location's fetched current conditions to its history.
+
+        Only observed readings are recorded, not conditions played back from
+        the hourly forecast, so the trend shows what was measured. A reading
+        already recorded is skipped by its timestamp.
+        """
+        for location, weather in zip(self.locations, self.weather):
+            if weather is not None:
+                self.history.append(location["name"], weather.current)
+
+    async def fetch_parts(self, loop, parts, now):
+        """Fetch the due parts for every location in one batch and reschedule them."""
+        # One request covers every location; locations whose data is still
+        # fresh are answered from the response cache
+        logger.info(f"Fetching {', '.join(parts)} for {len(self.locations)} location(s)...")
+        with metrics.span("fetch"):
+            results = await loop.run_in_executor(
+                self.work_executor, self.weather_service.get_weather_batch, self.locations, parts)
+        for index, result in enumerate(results):
+            if result is None:
+                logger.error(f"Failed to fetch weather data for {self.locations[index]['name']}")
+            self.weather[index] = WeatherService.merge(self.weather[index], result, parts)
+        for part in parts:
+            expiries = [expires_at(result, part, result.fetched_at or now) if result else None
+                        for result in results]
+            self.scheduler.record(part, None if None in expiries else min(expiries), now)
+        if any(results):
+            await loop.run_in_executor(self.work_executor, self.snapshot.save_weather, {
+                "locations": [location["name"] for location in self.locations],
+                "weather": [weather.to_dict() if weather else None for weather in self.weather],
+            })
+
+    def restore_weather(self):
+        """Seed the per-location weather with the last good payload, if any."""
+        payload = self.snapshot.load_weather()
+        if not payload:
+            return
+        saved = dict(zip(payload.get("locations", []), payload.get("weather", [])))
+        for index, location in enumerate(self.locations):
+            if self.weather[index] is None and saved.get(location["name"]):
+                try:
+                    self.weather[index] = WeatherData.from_dict(saved[location["name"]])
+                except (KeyError, TypeError, ValueError) as e:
+                    # e.g. a payload written by an older version
+                    logger.warning(f"Ignoring saved weather for {location['name']} ({e})")
+
+    async def render_stage(self, render_queue, panel_queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            location, weather, show = await render_queue.get()
+            if not show:
+                await loop.run_in_executor(
+                    self.work_executor, self.display_service.prerender, weather, location['name'])
+                continue
+            buffer = await loop.run_in_executor(
+                self.work_executor, self.display_service.render_frame, weather, location['name'])
+            if buffer is not None:
+                await panel_queue.put(buffer)
+
+    async def panel_stage(self, panel_queue):
+        loop = asyncio.get_running_loop()
         while True:
-            location = locations[current_location_index]
-            logger.info(f"Fetching weather data for {location['name']}...")
-            weather = weather_service.get_current_weather(lat=location['lat'], lon=location['lon'])
-            
-            if weather:
-                logger.info(f"Weather fetched: {weather}")
-                logger.info("Updating display...")
-                display_service.update_display(weather, location_name=location['name'])
+            buffer = await panel_queue.get()
+            logger.info("Updating display...")
+            try:
+                with metrics.span("refresh"):
+                    await loop.run_in_executor(self.panel_executor, self.display_service.refresh, buffer)
+            except Exception as e:
+                # e.g. a BUSY timeout from a disconnected panel; keep serving
+                # and retry with a full refresh on the next frame
+                logger.error(f"Display refresh failed: {e}")
             else:
-                logger.error("Failed to fetch weather data")
-
-            # Cycle to next location
-            current_location_index = (current_location_index + 1) % len(locations)
-
-            # Sleep for 60 minutes
-            logger.info("Sleeping for 60 minutes...")
-            time.sleep(60 * 60) 
-            
-    except KeyboardInterrupt:
-        logger.info("Exiting...")
-        display_service.clear()
-    except Exception as e:
-        logger.error(f"An error occurred: {e}", exc_info=True)
-        display_service.clear()
+                if "first_frame" not in self.startup:
+                    self.startup["first_frame"] = time.monotonic()
+                    self.log_startup_report()
+            # One JSON log line and textfile update per cycle
+            await loop.run_in_executor(self.work_executor, metrics.flush)
+
+    def log_startup_report(self):
+        # Restart=always makes slow starts visible, so break down where the
+        # time to the first frame goes
+        t = self.startup
+        logger.info(
+            "Startup: imports %.0f ms, panel init %.0f ms, first frame %.0f ms after start",
+            (t["imported"] - t["started"]) * 1000,
+            (t["panel_ready"] - t["panel_init_started"]) * 1000,
+            (t["first_frame"] - t["started"]) * 1000)
+
+
+def main():
+    logger.info("Starting Weather Display...")
+    asyncio.run(WeatherDisplayApp(LOCATIONS).run())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import logging
+import threading
+
+try:
+    from src.fileutil import write_atomic
+except ImportError:
+    from fileutil import write_atomic
+
+logger = logging.getLogger(__name__)
+
+# Prefix of every exported Prometheus metric
+METRIC_PREFIX = "eink_"
+
+
+class _NullSpan:
+    """Shared no-op span returned while metrics are disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('registry', 'key', 'start')
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.key, time.perf_counter() - self.start, failed=exc_type is not None)
+        return False
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _json_name(key):
+    name, labels = key
+    return name + "".join(f":{k}={v}" for k, v in labels)
+
+
+class MetricsRegistry:
+    """Stage timings and event counters for the display cycle.
+
+    Spans time a stage (fetch, decode, render, pack, SPI upload, BUSY wait)
+    and counters count events (cache lookups, HTTP errors, refresh modes).
+    Both are keyed by a name and optional labels. flush() exports totals as
+    a Prometheus textfile for node_exporter's textfile collector and logs
+    what happened since the previous flush as one JSON line.
+
+    A disabled registry hands out a shared no-op span and ignores counters,
+    so instrumentation can stay in hot paths.
+    """
+
+    def __init__(self, textfile=None, json_log=False):
+        """Initialize the registry.
+
+        Args:
+            textfile: Path of the Prometheus textfile, None to not write one
+            json_log: Log a JSON line with the cycle's spans on every flush
+        """
+        self.textfile = textfile
+        self.json_log = json_log
+        self.enabled = bool(textfile or json_log)
+        self._lock = threading.Lock()
+        # key -> [count, total seconds, last seconds, failures]
+        self._spans = {}
+        self._counters = {}
+        # Spans and counters since the last flush, for the JSON line
+        self._cycle_spans = {}
+        self._cycle_counters = {}
+
+    @classmethod
+    def from_env(cls):
+        """Configure from EINK_METRICS_TEXTFILE and EINK_METRICS_JSON."""
+        return cls(textfile=os.environ.get('EINK_METRICS_TEXTFILE') or None,
+                   json_log=os.environ.get('EINK_METRICS_JSON', '').lower() in ('1', 'true', 'yes'))
+
+    def span(self, name, **labels):
+        """Context manager timing one execution of a stage."""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, _key(name, labels))
+
+    def observe(self, key, seconds, failed=False):
+        with self._lock:
+            stats = self._spans.get(key)
+            if stats is None:
+                stats = self._spans[key] = [0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = seconds
+            stats[3] += failed
+            self._cycle_spans[key] = self._cycle_spans.get(key, 0.0) + seconds
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter."""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._cycle_counters[key] = self._cycle_counters.get(key, 0) + value
+
+    def render_prometheus(self):
+        """Totals in the Prometheus text exposition format."""
+        with self._lock:
+            spans = sorted(self._spans.items())
+            counters = sorted(self._counters.items())
+        stage = f"{METRIC_PREFIX}stage_seconds"
+        lines = [f"# HELP {stage} Time spent in each stage of the display cycle.",
+                 f"# TYPE {stage} summary"]
+        for (name, labels), (count, total, _, _) in spans:
+            label_text = _prometheus_labels((('stage', name),) + labels)
+            lines.append(f"{stage}_sum{label_text} {total:.6f}")
+            lines.append(f"{stage}_count{label_text} {count}")
+        lines.append(f"# TYPE {stage}_last gauge")
+        for (name, labels), (_, _, last, _) in spans:
+            lines.append(f"{stage}_last{_prometheus_labels((('stage', name),) + labels)} {last:.6f}")
+        lines.append(f"# TYPE {METRIC_PREFIX}stage_failures_total counter")
+        for (name, labels), (_, _, _, failures) in spans:
+            lines.append(f"{METRIC_PREFIX}stage_failures_total"
+                         f"{_prometheus_labels((('stage', name),) + labels)} {failures}")
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_prometheus_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Replace the textfile atomically so the collector never reads half of it."""
+        write_atomic(path, self.render_prometheus(), mode=0o644)
+
+    def flush(self, event="cycle"):
+        """Export metrics at the end of a display cycle."""
+        if not self.enabled:
+            return
+        with self._lock:
+            cycle_spans, self._cycle_spans = self._cycle_spans, {}
+            cycle_counters, self._cycle_counters = self._cycle_counters, {}
+        if self.json_log:
+            logger.info(json.dumps({
+                "event": event,
+                "ms": {_json_name(k): round(v * 1000, 3) for k, v in sorted(cycle_spans.items())},
+                "counts": {_json_name(k): v for k, v in sorted(cycle_counters.items())},
+            }, separators=(',', ':')))
+        if self.textfile:
+            try:
+                self.write_textfile(self.textfile)
+            except OSError as e:
+                logger.warning(f"Could not write metrics textfile ({e})")
+
+
+registry = MetricsRegistry.from_env()
+
+
+def span(name, **labels):
+    """Time a stage with the shared registry, see MetricsRegistry.span."""
+    return registry.span(name, **labels)
+
+
+def inc(name, value=1, **labels):
+    """Count an event in the shared registry, see MetricsRegistry.inc."""
+    registry.inc(name, value, **labels)
+
+
+def flush(event="cycle"):
+    registry.flush(event)
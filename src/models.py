@@ -0,0 +1,363 @@
+import math
+import zlib
+from array import array
+from datetime import date
+from dataclasses import dataclass
+
+try:
+    from src.scheduler import parse_local_time
+except ImportError:
+    from scheduler import parse_local_time
+
+# Stored for weather codes the API left out (null); maps to the default icon
+MISSING_CODE = -1
+
+
+def _floats(values, length, typecode='f'):
+    """float32 column (float64 with typecode 'd'); missing values become NaN."""
+    values = values or ()
+    column = array(typecode, (math.nan if v is None else v for v in values))
+    if len(column) < length:
+        column.extend([math.nan] * (length - len(column)))
+    return column
+
+
+def _codes(values, length):
+    values = values or ()
+    column = array('h', (MISSING_CODE if v is None else v for v in values))
+    if len(column) < length:
+        column.extend([MISSING_CODE] * (length - len(column)))
+    return column
+
+
+def _times(values, utc_offset):
+    """Epoch seconds column from local ISO times; missing values become NaN."""
+    parsed = (parse_local_time(v, utc_offset) for v in values or ())
+    return array('d', (math.nan if t is None else t for t in parsed))
+
+
+def _checksum(columns):
+    crc = 0
+    for column in columns:
+        crc = zlib.crc32(column.tobytes(), crc)
+    return crc
+
+
+def _same_column(a, b):
+    """Whether two columns hold the same values; missing (NaN) values compare equal."""
+    return a.typecode == b.typecode and a.tobytes() == b.tobytes()
+
+
+def _column_list(column):
+    """Column as a JSON-friendly list, NaN as None."""
+    if column.typecode == 'h':
+        return [None if v == MISSING_CODE else v for v in column]
+    return [None if math.isnan(v) else v for v in column]
+
+
+def value_or_none(value):
+    """A column value, or None where it is missing."""
+    if isinstance(value, int):
+        return None if value == MISSING_CODE else value
+    return None if math.isnan(value) else value
+
+
+@dataclass(frozen=True)
+class CurrentConditions:
+    """Conditions at one point in time, as shown in the top half of the layout."""
+    __slots__ = ('temperature', 'apparent_temperature', 'windspeed', 'winddirection',
+                 'weathercode', 'is_day', 'time', 'interval')
+    temperature: float
+    apparent_temperature: float
+    windspeed: float
+    winddirection: float
+    weathercode: int
+    is_day: int             # 1 day, 0 night, None if unknown
+    time: float             # Epoch seconds the conditions start at
+    interval: int           # Seconds the conditions are valid for
+
+    @classmethod
+    def from_api(cls, block, utc_offset):
+        is_day = block.get("is_day")
+        return cls(
+            temperature=block.get("temperature_2m"),
+            apparent_temperature=block.get("apparent_temperature"),
+            windspeed=block.get("wind_speed_10m"),
+            winddirection=block.get("wind_direction_10m"),
+            weathercode=block.get("weather_code"),
+            is_day=None if is_day is None else (1 if is_day else 0),
+            time=parse_local_time(block.get("time"), utc_offset),
+            interval=block.get("interval"),
+        )
+
+    def replace(self, **changes):
+        values = self.to_dict()
+        values.update(changes)
+        return CurrentConditions(**values)
+
+    def to_dict(self):
+        # Plain slot reads; dataclasses.asdict deep-copies every field
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+
+
+class DailySeries:
+    """Daily forecast as columns, with dates and sun times parsed at ingest.
+
+    Equal series have equal versions, a checksum of every column, so a
+    changed forecast is detected without comparing values one by one.
+    """
+    __slots__ = ('dates', 'weathercode', 'temperature_max', 'temperature_min',
+                 'sunrise', 'sunset', 'version')
+
+    def __init__(self, dates, weathercode, temperature_max, temperature_min, sunrise, sunset):
+        """Initialize the series.
+
+        Args:
+            dates: Tuple of datetime.date, local to the location
+            weathercode: array('h') of WMO codes, MISSING_CODE where missing
+            temperature_max, temperature_min: array('f') in degrees C
+            sunrise, sunset: array('d') of epoch seconds, NaN where missing
+        """
+        self.dates = dates
+        self.weathercode = weathercode
+        self.temperature_max = temperature_max
+        self.temperature_min = temperature_min
+        self.sunrise = sunrise
+        self.sunset = sunset
+        self.version = _checksum((array('l', (d.toordinal() for d in dates)), weathercode,
+                                  temperature_max, temperature_min, sunrise, sunset))
+
+    @classmethod
+    def from_api(cls, block, utc_offset):
+        dates = tuple(date.fromisoformat(day) for day in block.get("time") or ())
+        n = len(dates)
+        sunrise = _times(block.get("sunrise"), utc_offset)
+        sunset = _times(block.get("sunset"), utc_offset)
+        sunrise.extend([math.nan] * (n - len(sunrise)))
+        sunset.extend([math.nan] * (n - len(sunset)))
+        return cls(dates, _codes(block.get("weathercode"), n),
+                   _floats(block.get("temperature_2m_max"), n),
+                   _floats(block.get("temperature_2m_min"), n), sunrise, sunset)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def index(self, day):
+        """Position of a datetime.date in the series, or None."""
+        try:
+            return self.dates.index(day)
+        except ValueError:
+            return None
+
+    def __eq__(self, other):
+        if not isinstance(other, DailySeries):
+            return NotImplemented
+        return (self.version == other.version and self.dates == other.dates
+                and all(_same_column(getattr(self, c), getattr(other, c))
+                        for c in ('weathercode', 'temperature_max', 'temperature_min', 'sunrise', 'sunset')))
+
+    def __hash__(self):
+        return self.version
+
+    def to_dict(self):
+        return {
+            "dates": [day.isoformat() for day in self.dates],
+            "weathercode": _column_list(self.weathercode),
+            "temperature_max": _column_list(self.temperature_max),
+            "temperature_min": _column_list(self.temperature_min),
+            "sunrise": _column_list(self.sunrise),
+            "sunset": _column_list(self.sunset),
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        dates = tuple(date.fromisoformat(day) for day in values["dates"])
+        n = len(dates)
+        return cls(dates, _codes(values["weathercode"], n),
+                   _floats(values["temperature_max"], n), _floats(values["temperature_min"], n),
+                   _floats(values["sunrise"], n, 'd'), _floats(values["sunset"], n, 'd'))
+
+
+class HourlySeries:
+    """Hourly forecast as columns on a regular time axis.
+
+    Open-Meteo's hourly series is regular, so the time axis is kept as a
+    start and a step instead of one parsed timestamp per value.
+    """
+    __slots__ = ('start', 'step', 'temperature', 'apparent_temperature', 'windspeed',
+                 'winddirection', 'weathercode', 'version')
+    COLUMNS = ('temperature', 'apparent_temperature', 'windspeed', 'winddirection', 'weathercode')
+
+    def __init__(self, start, step, temperature, apparent_temperature, windspeed, winddirection, weathercode):
+        """Initialize the series.
+
+        Args:
+            start: Epoch seconds of the first value
+            step: Seconds between values
+            temperature, apparent_temperature, windspeed, winddirection: array('f')
+            weathercode: array('h') of WMO codes, MISSING_CODE where missing
+        """
+        self.start = start
+        self.step = step
+        self.temperature = temperature
+        self.apparent_temperature = apparent_temperature
+        self.windspeed = windspeed
+        self.winddirection = winddirection
+        self.weathercode = weathercode
+        self.version = _checksum((array('d', (start, step)),) + tuple(getattr(self, c) for c in self.COLUMNS))
+
+    @classmethod
+    def from_api(cls, block, utc_offset):
+        times = block.get("time") or ()
+        start = parse_local_time(times[0], utc_offset) if times else None
+        if start is None:
+            return None
+        second = parse_local_time(times[1], utc_offset) if len(times) > 1 else None
+        n = len(times)
+        return cls(start, (second - start) if second else 3600,
+                   _floats(block.get("temperature_2m"), n),
+                   _floats(block.get("apparent_temperature"), n),
+                   _floats(block.get("wind_speed_10m"), n),
+                   _floats(block.get("wind_direction_10m"), n),
+                   _codes(block.get("weather_code"), n))
+
+    def __len__(self):
+        return len(self.temperature)
+
+    def locate(self, when):
+        """(index, fraction) of a time between two values, or None outside the series."""
+        index, remainder = divmod(when - self.start, self.step)
+        index = int(index)
+        if index < 0 or index >= len(self):
+            return None
+        return index, remainder / self.step
+
+    def __eq__(self, other):
+        if not isinstance(other, HourlySeries):
+            return NotImplemented
+        return (self.version == other.version and self.start == other.start and self.step == other.step
+                and all(_same_column(getattr(self, c), getattr(other, c)) for c in self.COLUMNS))
+
+    def __hash__(self):
+        return self.version
+
+    def to_dict(self):
+        values = {"start": self.start, "step": self.step}
+        values.update((c, _column_list(getattr(self, c))) for c in self.COLUMNS)
+        return values
+
+    @classmethod
+    def from_dict(cls, values):
+        n = len(values["temperature"])
+        return cls(values["start"], values["step"], _floats(values["temperature"], n),
+                   _floats(values["apparent_temperature"], n), _floats(values["windspeed"], n),
+                   _floats(values["winddirection"], n), _codes(values["weathercode"], n))
+
+
+class WeatherData:
+    """Weather for one location: current conditions and hourly and daily series.
+
+    Instances are immutable by convention; replace() and merge() return new
+    ones. Two instances are equal when they would display the same; the
+    series compare by version first, so unchanged data is cheap to detect.
+    """
+    __slots__ = ('current', 'hourly', 'daily', 'latitude', 'longitude', 'utc_offset', 'fetched_at')
+    PARTS = ('current', 'hourly', 'daily')
+
+    def __init__(self, current=None, hourly=None, daily=None, latitude=None, longitude=None,
+                 utc_offset=0, fetched_at=None):
+        """Initialize the weather.
+
+        Args:
+            current: CurrentConditions or None
+            hourly: HourlySeries or None
+            daily: DailySeries or None
+            latitude, longitude: Coordinates the API answered for
+            utc_offset: Seconds the location's local time is ahead of UTC
+            fetched_at: Epoch seconds the data was fetched, if known
+        """
+        self.current = current
+        self.hourly = hourly
+        self.daily = daily
+        self.latitude = latitude
+        self.longitude = longitude
+        self.utc_offset = utc_offset
+        self.fetched_at = fetched_at
+
+    @classmethod
+    def from_api(cls, data, fetched_at=None):
+        """Build from a decoded Open-Meteo response for one location."""
+        utc_offset = data.get("utc_offset_seconds") or 0
+        current = data.get("current")
+        hourly = data.get("hourly")
+        daily = data.get("daily")
+        return cls(
+            current=CurrentConditions.from_api(current, utc_offset) if current is not None else None,
+            hourly=HourlySeries.from_api(hourly, utc_offset) if hourly is not None else None,
+            daily=DailySeries.from_api(daily, utc_offset) if daily is not None else None,
+            latitude=data.get("latitude"),
+            longitude=data.get("longitude"),
+            utc_offset=utc_offset,
+            fetched_at=fetched_at,
+        )
+
+    @property
+    def version(self):
+        """Hashable summary of the displayed data; differs whenever the data does."""
+        return (self.current, self.hourly and self.hourly.version, self.daily and self.daily.version)
+
+    def replace(self, **changes):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return WeatherData(**values)
+
+    def merge(self, update, parts=PARTS):
+        """Copy with the given parts taken from update where it has them."""
+        if update is None:
+            return self
+        changes = {part: getattr(update, part) for part in parts if getattr(update, part) is not None}
+        for name in ('latitude', 'longitude'):
+            if getattr(update, name) is not None:
+                changes[name] = getattr(update, name)
+        changes['utc_offset'] = update.utc_offset
+        return self.replace(**changes)
+
+    def __eq__(self, other):
+        if not isinstance(other, WeatherData):
+            return NotImplemented
+        return (self.utc_offset == other.utc_offset and self.current == other.current
+                and self.hourly == other.hourly and self.daily == other.daily)
+
+    def __hash__(self):
+        return hash(self.version)
+
+    def __repr__(self):
+        return (f"WeatherData(current={self.current}, hourly={len(self.hourly) if self.hourly else 0}h, "
+                f"daily={len(self.daily) if self.daily else 0}d, utc_offset={self.utc_offset})")
+
+    def to_dict(self):
+        return {
+            "current": self.current.to_dict() if self.current else None,
+            "hourly": self.hourly.to_dict() if self.hourly else None,
+            "daily": self.daily.to_dict() if self.daily else None,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "utc_offset": self.utc_offset,
+            "fetched_at": self.fetched_at,
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(
+            current=CurrentConditions.from_dict(values["current"]) if values.get("current") else None,
+            hourly=HourlySeries.from_dict(values["hourly"]) if values.get("hourly") else None,
+            daily=DailySeries.from_dict(values["daily"]) if values.get("daily") else None,
+            latitude=values.get("latitude"),
+            longitude=values.get("longitude"),
+            utc_offset=values.get("utc_offset") or 0,
+            fetched_at=values.get("fetched_at"),
+        )
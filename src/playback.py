@@ -0,0 +1,158 @@
+import math
+from datetime import datetime, timezone
+
+try:
+    from src.models import CurrentConditions, value_or_none
+except ImportError:
+    from models import CurrentConditions, value_or_none
+
+# Granularity of the locally played back conditions
+PLAYBACK_STEP = 15 * 60
+
+# Sun elevation at sunrise/sunset, accounting for refraction and the disc
+SUNRISE_ELEVATION = -0.833
+
+# 2000-01-01T12:00Z, the J2000 epoch used by the solar position formulas
+_J2000 = 946728000
+
+
+def solar_elevation(lat, lon, when):
+    """Approximate sun elevation in degrees (accurate to about 0.1 degree).
+
+    Args:
+        lat, lon: Coordinates in degrees
+        when: Epoch seconds
+    """
+    d = (when - _J2000) / 86400.0
+    g = math.radians((357.529 + 0.98560028 * d) % 360)
+    q = (280.459 + 0.98564736 * d) % 360
+    ecliptic_lon = math.radians(q + 1.915 * math.sin(g) + 0.020 * math.sin(2 * g))
+    obliquity = math.radians(23.439 - 0.00000036 * d)
+    right_ascension = math.atan2(math.cos(obliquity) * math.sin(ecliptic_lon), math.cos(ecliptic_lon))
+    declination = math.asin(math.sin(obliquity) * math.sin(ecliptic_lon))
+    sidereal_hours = (18.697374558 + 24.06570982441908 * d) % 24
+    hour_angle = math.radians(sidereal_hours * 15 + lon) - right_ascension
+    lat = math.radians(lat)
+    return math.degrees(math.asin(math.sin(lat) * math.sin(declination)
+                                  + math.cos(lat) * math.cos(declination) * math.cos(hour_angle)))
+
+
+def local_date(when, utc_offset):
+    return datetime.fromtimestamp(when + (utc_offset or 0), timezone.utc).date()
+
+
+def is_day_at(weather, when):
+    """Whether the sun is up at a location, computed on the device.
+
+    Uses the daily sunrise/sunset of the local date, and the solar position
+    where those are missing, e.g. during polar day or night.
+
+    Args:
+        weather: WeatherData
+        when: Epoch seconds
+
+    Returns:
+        1 for day, 0 for night, None if neither source is available
+    """
+    daily = weather.daily
+    index = daily.index(local_date(when, weather.utc_offset)) if daily is not None else None
+    if index is not None:
+        sunrise, sunset = daily.sunrise[index], daily.sunset[index]
+        if not (math.isnan(sunrise) or math.isnan(sunset)):
+            return 1 if sunrise <= when < sunset else 0
+
+    lat, lon = weather.latitude, weather.longitude
+    if lat is None or lon is None:
+        return None
+    return 1 if solar_elevation(lat, lon, when) > SUNRISE_ELEVATION else 0
+
+
+def _interpolate(values, index, fraction):
+    a = values[index]
+    b = values[index + 1] if index + 1 < len(values) else math.nan
+    if math.isnan(a):
+        return None
+    if math.isnan(b):
+        return a
+    return a + (b - a) * fraction
+
+
+def _interpolate_angle(values, index, fraction):
+    a = values[index]
+    b = values[index + 1] if index + 1 < len(values) else math.nan
+    if math.isnan(a):
+        return None
+    if math.isnan(b):
+        return a
+    delta = (b - a + 180) % 360 - 180
+    return (a + delta * fraction) % 360
+
+
+def current_at(weather, when):
+    """Current conditions played back from the hourly series.
+
+    Values are interpolated linearly between the hours around the start of
+    the PLAYBACK_STEP slot containing when, and the weather code is the one
+    of the hour the slot falls in.
+
+    Args:
+        weather: WeatherData with an hourly series
+        when: Epoch seconds
+
+    Returns:
+        CurrentConditions, or None if the series does not cover when
+    """
+    hourly = weather.hourly
+    if hourly is None:
+        return None
+    slot = when - when % PLAYBACK_STEP
+    position = hourly.locate(slot)
+    if position is None:
+        return None
+    index, fraction = position
+
+    def value(column, digits=1):
+        result = _interpolate(column, index, fraction)
+        return round(result, digits) if result is not None else None
+
+    direction = _interpolate_angle(hourly.winddirection, index, fraction)
+    return CurrentConditions(
+        temperature=value(hourly.temperature),
+        apparent_temperature=value(hourly.apparent_temperature),
+        windspeed=value(hourly.windspeed),
+        winddirection=round(direction) if direction is not None else None,
+        weathercode=value_or_none(hourly.weathercode[index]),
+        is_day=is_day_at(weather, slot),
+        time=slot,
+        interval=PLAYBACK_STEP,
+    )
+
+
+def view(weather, when):
+    """Weather as it should be shown at a given time.
+
+    The current conditions are played back from the hourly series when it
+    covers when. Otherwise the fetched conditions are kept, with is_day
+    filled in on the device since the API block does not carry it.
+
+    Args:
+        weather: Merged WeatherData, see WeatherService.merge
+        when: Epoch seconds
+
+    Returns:
+        New WeatherData, or weather itself if there is nothing to update
+    """
+    if not weather:
+        return weather
+    current = current_at(weather, when)
+    if current is None:
+        current = weather.current
+        if current is None or current.is_day is not None:
+            return weather
+        current = current.replace(is_day=is_day_at(weather, when))
+    return weather.replace(current=current)
+
+
+def next_step(when):
+    """Epoch seconds when the next PLAYBACK_STEP slot starts."""
+    return when - when % PLAYBACK_STEP + PLAYBACK_STEP
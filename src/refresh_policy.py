@@ -0,0 +1,88 @@
+class RefreshMode:
+    """Refresh modes the panel supports, cheapest first."""
+    SKIP = 'skip'
+    PARTIAL = 'partial'
+    FAST = 'fast'
+    FULL = 'full'
+
+
+def count_changed_pixels(previous, current):
+    """Count the pixels that differ between two packed 1-bit buffers.
+
+    Args:
+        previous: Packed framebuffer currently shown on the panel
+        current: Packed framebuffer about to be shown
+
+    Returns:
+        Number of differing bits, or None if the buffers are not comparable
+    """
+    if previous is None or len(previous) != len(current):
+        return None
+    diff = int.from_bytes(bytes(previous), 'big') ^ int.from_bytes(bytes(current), 'big')
+    return bin(diff).count('1')
+
+
+class RefreshPolicy:
+    """Chooses between partial, fast and full refresh for each frame.
+
+    Partial refreshes are quick and do not flash, but leave ghosting behind,
+    so they are only used for small changes and only a limited number of
+    times before a full refresh cleans the panel. Large changes use the fast
+    waveform, which flashes once but is still much quicker than a full one.
+    """
+
+    def __init__(self, partial_threshold=0.15, max_partials=10, max_fast=5):
+        """Initialize the policy.
+
+        Args:
+            partial_threshold: Largest fraction of changed pixels that is
+                still refreshed with the partial waveform
+            max_partials: Partial refreshes allowed between two full refreshes
+            max_fast: Fast refreshes allowed between two full refreshes
+        """
+        self.partial_threshold = partial_threshold
+        self.max_partials = max_partials
+        self.max_fast = max_fast
+        self.partials_since_full = 0
+        self.fast_since_full = 0
+
+    def decide(self, previous, current):
+        """Pick the refresh mode for a new frame.
+
+        Args:
+            previous: Packed framebuffer currently shown, or None if unknown
+            current: Packed framebuffer about to be shown
+
+        Returns:
+            One of the RefreshMode values
+        """
+        changed = count_changed_pixels(previous, current)
+        if changed is None:
+            return RefreshMode.FULL
+        if changed == 0:
+            return RefreshMode.SKIP
+
+        total = len(current) * 8
+        if changed <= total * self.partial_threshold:
+            if self.partials_since_full < self.max_partials:
+                return RefreshMode.PARTIAL
+        elif self.fast_since_full < self.max_fast:
+            return RefreshMode.FAST
+        return RefreshMode.FULL
+
+    def record(self, mode):
+        """Update the ghosting counters after a refresh was performed."""
+        if mode == RefreshMode.FULL:
+            self.partials_since_full = 0
+            self.fast_since_full = 0
+        elif mode == RefreshMode.FAST:
+            # The fast waveform drives every pixel, which clears partial ghosting
+            self.partials_since_full = 0
+            self.fast_since_full += 1
+        elif mode == RefreshMode.PARTIAL:
+            self.partials_since_full += 1
+
+    def reset(self):
+        """Forget the refresh history, e.g. after the panel was cleared."""
+        self.partials_since_full = 0
+        self.fast_since_full = 0
@@ -0,0 +1,193 @@
+import time
+import random
+import logging
+import threading
+import requests
+
+try:
+    from src import metrics
+except ImportError:
+    import metrics
+
+logger = logging.getLogger(__name__)
+
+# Responses worth another attempt: throttling and transient server errors
+RETRYABLE_STATUS = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+
+class DeadlineExceeded(requests.Timeout):
+    """The total time budget of a call ran out."""
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker is open, no request was made."""
+
+
+class Deadline:
+    """Absolute time budget shared by every attempt of one call."""
+    __slots__ = ('expires',)
+
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def check(self):
+        """Raise DeadlineExceeded if the budget is used up."""
+        if time.monotonic() >= self.expires:
+            raise DeadlineExceeded("fetch deadline exceeded")
+
+
+def is_retryable(error):
+    """Whether a failed request may succeed if simply tried again.
+
+    Connection errors, timeouts, truncated bodies, throttling and 5xx
+    responses are; other 4xx responses and undecodable bodies are not.
+    """
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in RETRYABLE_STATUS
+    return isinstance(error, (requests.ConnectionError, requests.Timeout,
+                              requests.exceptions.ChunkedEncodingError,
+                              requests.exceptions.ContentDecodingError))
+
+
+def retry_after(error):
+    """Seconds from a Retry-After header on the failed response, or None."""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        # HTTP-date form; the backoff applies instead
+        return None
+
+
+class CircuitBreaker:
+    """Stops calling an API that keeps failing, and probes it now and then.
+
+    After failure_threshold consecutive retryable failures the breaker
+    opens and calls are refused at once. After reset_timeout seconds one
+    trial call is let through; its success closes the breaker again, its
+    failure keeps it open for another reset_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=120):
+        """Initialize the breaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout: Seconds the breaker stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead now."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Weather API reachable again, circuit closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Weather API failing, circuit open for {self.reset_timeout} s")
+                    metrics.inc("circuit_opened")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+
+class RetryPolicy:
+    """Bounded retries with exponential backoff and jitter inside a deadline."""
+
+    def __init__(self, attempts=3, backoff_base=0.5, backoff_max=5.0, deadline=20.0):
+        """Initialize the policy.
+
+        Args:
+            attempts: Most attempts per call, including the first
+            backoff_base: Delay in seconds before the first retry
+            backoff_max: Longest delay between two attempts
+            deadline: Total seconds a call may take, retries included
+        """
+        self.attempts = attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+
+    def backoff(self, attempt, error=None):
+        """Delay before retrying after the given (0-based) attempt failed."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        delay *= random.uniform(0.8, 1.2)
+        hint = retry_after(error)
+        return max(delay, hint) if hint is not None else delay
+
+    def call(self, operation, breaker=None):
+        """Run operation(deadline) until it succeeds or may not be retried.
+
+        Args:
+            operation: Callable taking the call's Deadline
+            breaker: CircuitBreaker guarding the API, or None
+
+        Returns:
+            What operation returned
+
+        Raises:
+            CircuitOpenError: If the breaker refused the call
+            Exception: The last error, once it is not retryable, the
+                attempts are used up, or no retry fits in the deadline
+        """
+        deadline = Deadline(self.deadline)
+        for attempt in range(self.attempts):
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError("weather API circuit is open")
+            try:
+                result = operation(deadline)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if breaker is not None:
+                    # A 4xx or a bad body means the API is up; only
+                    # outages count towards opening the breaker
+                    if retryable:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                if not retryable or attempt + 1 == self.attempts:
+                    raise
+                delay = self.backoff(attempt, e)
+                if delay >= deadline.remaining():
+                    raise
+                logger.info(f"Fetch failed ({e}), retrying in {delay:.1f} s")
+                metrics.inc("fetch_retries", error=type(e).__name__)
+                time.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return result
@@ -0,0 +1,128 @@
+import random
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+# Parts of an Open-Meteo forecast that are fetched on their own cadence
+CURRENT = "current"
+HOURLY = "hourly"
+DAILY = "daily"
+PARTS = (CURRENT, HOURLY, DAILY)
+
+# Open-Meteo's current block covers 15 minutes when no interval is reported
+DEFAULT_INTERVAL = 15 * 60
+# The next current block shows up shortly after its interval starts
+PUBLISH_DELAY = 60
+# Hourly and daily values change with model runs a few times a day, not
+# every interval; the hourly series is played back locally in between
+HOURLY_TTL = 3 * 60 * 60
+DAILY_TTL = 3 * 60 * 60
+
+
+def parse_local_time(text, utc_offset):
+    """Convert an Open-Meteo local timestamp to epoch seconds.
+
+    Args:
+        text: ISO time such as "2026-10-17T14:15", in the location's time zone
+        utc_offset: The response's utc_offset_seconds
+
+    Returns:
+        Epoch seconds, or None if text is missing or malformed
+    """
+    if not text:
+        return None
+    try:
+        local = datetime.fromisoformat(text[:16])
+    except ValueError:
+        return None
+    return (local - _EPOCH) // _SECOND - (utc_offset or 0)
+
+
+def next_local_midnight(now, utc_offset):
+    """Epoch seconds of the next midnight in a time zone with a fixed UTC offset."""
+    offset = utc_offset or 0
+    return ((now + offset) // 86400 + 1) * 86400 - offset
+
+
+def expires_at(weather, part, fetched_at, daily_ttl=DAILY_TTL):
+    """When a part of the weather data is superseded upstream.
+
+    The current block is replaced one interval after its own timestamp. The
+    hourly series is refreshed every HOURLY_TTL, and the daily block every
+    daily_ttl and at local midnight, when the forecast days roll over.
+
+    Args:
+        weather: WeatherData, see WeatherService.normalize
+        part: CURRENT, HOURLY or DAILY
+        fetched_at: Epoch seconds the data was fetched
+
+    Returns:
+        Epoch seconds, or None if the part is missing
+    """
+    if not weather or getattr(weather, part) is None:
+        return None
+    if part == CURRENT:
+        current = weather.current
+        if current.time is None:
+            return fetched_at + DEFAULT_INTERVAL
+        return current.time + (current.interval or DEFAULT_INTERVAL) + PUBLISH_DELAY
+    if part == HOURLY:
+        return fetched_at + HOURLY_TTL
+    return min(fetched_at + daily_ttl, next_local_midnight(fetched_at, weather.utc_offset))
+
+
+class FetchScheduler:
+    """Decides when each part of the forecast needs to be fetched again.
+
+    A part is due when the data last received for it expires upstream, see
+    expires_at. If a fetch brings no newer data (the request failed, or the
+    API has not published the next block yet), the part is retried with
+    exponential backoff and jitter instead of waiting for the next cycle.
+    """
+
+    def __init__(self, parts=PARTS, min_interval=60, backoff_base=60, backoff_max=10 * 60):
+        """Initialize the scheduler.
+
+        Args:
+            parts: Forecast parts to keep up to date
+            min_interval: Shortest time between two fetches of the same part
+            backoff_base: First retry delay in seconds after a failed fetch
+            backoff_max: Longest retry delay in seconds
+        """
+        self.min_interval = min_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.parts = parts
+        self.next_due = {part: 0.0 for part in parts}
+        self.failures = {part: 0 for part in parts}
+
+    def due(self, now):
+        """Parts to fetch now, fetched together in one request."""
+        return tuple(part for part in self.parts if self.next_due[part] <= now)
+
+    def record(self, part, expiry, now):
+        """Schedule the next fetch of a part after fetching it.
+
+        Args:
+            part: CURRENT, HOURLY or DAILY
+            expiry: Earliest expires_at over all locations, None if any
+                location has no data for the part
+            now: Epoch seconds of the fetch
+        """
+        if expiry is None or expiry <= now:
+            self.failures[part] += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (self.failures[part] - 1))
+            delay *= random.uniform(0.8, 1.2)
+            logger.info(f"No new {part} data, retrying in {delay:.0f} s")
+            self.next_due[part] = now + delay
+        else:
+            self.failures[part] = 0
+            self.next_due[part] = max(expiry, now + self.min_interval)
+
+    def next_wake(self):
+        """Epoch seconds when the next part becomes due."""
+        return min(self.next_due.values())
@@ -0,0 +1,122 @@
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import logging
+
+try:
+    from src.fileutil import write_atomic
+except ImportError:
+    from fileutil import write_atomic
+
+logger = logging.getLogger(__name__)
+
+# magic, width, height, panel state, saved_at, crc32 of the frame
+FRAME_HEADER = struct.Struct('<8sHHB3xdI')
+FRAME_MAGIC = b'EINKFRM1'
+
+
+class PanelState:
+    CLEARED = 0     # Panel was cleared after the frame was saved
+    SHOWN = 1       # Panel still shows the saved frame
+
+
+def default_state_dir():
+    """State directory, overridable with EINK_WEATHER_STATE_DIR."""
+    state_home = os.environ.get('XDG_STATE_HOME', os.path.join(os.path.expanduser('~'), '.local', 'state'))
+    return os.environ.get('EINK_WEATHER_STATE_DIR', os.path.join(state_home, 'eink_weather'))
+
+
+class SavedFrame:
+    __slots__ = ('data', 'state', 'saved_at')
+
+    def __init__(self, data, state, saved_at):
+        self.data = data
+        self.state = state
+        self.saved_at = saved_at
+
+
+class Snapshot:
+    """Last frame on the panel and last good weather, kept across restarts.
+
+    The packed frame is stored with a small header (size, panel state, CRC)
+    and read back through mmap; the weather payload is stored as JSON. Both
+    are replaced atomically and fsynced, so a crash or power cut leaves the
+    previous snapshot rather than a torn one.
+    """
+
+    FRAME_FILE = 'frame.bin'
+    WEATHER_FILE = 'weather.json'
+
+    def __init__(self, state_dir=None):
+        """Initialize the snapshot store.
+
+        Args:
+            state_dir: Directory for the files, None for default_state_dir()
+        """
+        self.state_dir = state_dir or default_state_dir()
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"Snapshot disabled ({e})")
+            self.state_dir = None
+        self._frame = None
+
+    def _path(self, name):
+        return os.path.join(self.state_dir, name)
+
+    def _write_atomic(self, name, data):
+        if self.state_dir is None:
+            return
+        try:
+            write_atomic(self._path(name), data, fsync=True)
+        except OSError as e:
+            logger.warning(f"Could not write {name} ({e})")
+
+    def load_frame(self, width, height):
+        """Return the SavedFrame for a panel size, or None if there is no valid one."""
+        if self.state_dir is None:
+            return None
+        size = ((width + 7) // 8) * height
+        try:
+            with open(self._path(self.FRAME_FILE), 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                if len(m) != FRAME_HEADER.size + size:
+                    return None
+                magic, w, h, state, saved_at, crc = FRAME_HEADER.unpack_from(m)
+                data = m[FRAME_HEADER.size:]
+        except (OSError, ValueError) as e:
+            logger.debug(f"No saved frame ({e})")
+            return None
+        if magic != FRAME_MAGIC or (w, h) != (width, height) or zlib.crc32(data) != crc:
+            logger.warning("Ignoring invalid saved frame")
+            return None
+        self._frame = (width, height, data)
+        return SavedFrame(data, state, saved_at)
+
+    def save_frame(self, width, height, data, state=PanelState.SHOWN):
+        data = bytes(data)
+        header = FRAME_HEADER.pack(FRAME_MAGIC, width, height, state, time.time(), zlib.crc32(data))
+        self._write_atomic(self.FRAME_FILE, header + data)
+        self._frame = (width, height, data)
+
+    def mark_cleared(self):
+        """Record that the panel no longer shows the saved frame."""
+        if self._frame is not None:
+            width, height, data = self._frame
+            self.save_frame(width, height, data, PanelState.CLEARED)
+
+    def load_weather(self):
+        """Return the saved weather payload, or None."""
+        if self.state_dir is None:
+            return None
+        try:
+            with open(self._path(self.WEATHER_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_weather(self, payload):
+        self._write_atomic(self.WEATHER_FILE, json.dumps(payload, separators=(',', ':')).encode('utf-8'))
@@ -0,0 +1,138 @@
+import calendar
+import threading
+from collections import OrderedDict
+from PIL import ImageFont
+
+try:
+    from src.fonts import get_font
+except ImportError:
+    from fonts import get_font
+
+# Everything the layout displays: numbers and units, day abbreviations,
+# cardinal directions and the wind line
+ALPHABET = frozenset(
+    "0123456789+-.,:/()° CFkmhp" + "NESW" + "".join(calendar.day_abbr))
+
+# Pillow's layout without kerning or shaping, where a string's extent is
+# exactly the sum of its glyph advances
+_LAYOUT_BASIC = getattr(getattr(ImageFont, 'Layout', None), 'BASIC', 0)
+
+
+class GlyphTable:
+    """Advance and horizontal ink extent of every glyph in an alphabet for one font."""
+    __slots__ = ('advance', 'left', 'right')
+
+    def __init__(self, font, alphabet=ALPHABET):
+        self.advance = {}
+        self.left = {}
+        self.right = {}
+        for char in alphabet:
+            left, _, right, _ = font.getbbox(char)
+            self.advance[char] = int(font.getlength(char))
+            self.left[char] = left
+            self.right[char] = right
+
+    def extent(self, text):
+        """(left, right) ink extent of text drawn at x = 0.
+
+        Raises:
+            KeyError: If text has a character outside the alphabet
+        """
+        advance = self.advance
+        return self.left[text[0]], sum(advance[c] for c in text[:-1]) + self.right[text[-1]]
+
+
+class TextLayout:
+    """Text measurement without rendering, for centering and fitting text.
+
+    Strings made of the displayed alphabet are measured from per-font glyph
+    tables. Anything else (or any string when Pillow shapes text with raqm,
+    where kerning breaks the table sums) is measured once and kept in a
+    bounded LRU cache keyed by font and string.
+    """
+
+    def __init__(self, alphabet=ALPHABET, max_extents=256):
+        """Initialize the layout.
+
+        Args:
+            alphabet: Characters to build glyph tables for
+            max_extents: Number of (font, string) extents cached
+        """
+        self.alphabet = alphabet
+        self.max_extents = max_extents
+        self._tables = {}
+        self._extents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def table(self, font):
+        """GlyphTable of a font, None if the font's layout is not table-exact."""
+        if getattr(font, 'layout_engine', None) != _LAYOUT_BASIC:
+            return None
+        key = (font.path, font.size)
+        table = self._tables.get(key)
+        if table is None:
+            table = GlyphTable(font, self.alphabet)
+            with self._lock:
+                self._tables[key] = table
+        return table
+
+    def extent(self, font, text):
+        """(left, right) ink extent of text drawn at x = 0, like draw.textbbox."""
+        if not text:
+            return 0, 0
+        table = self.table(font)
+        if table is not None:
+            try:
+                return table.extent(text)
+            except KeyError:
+                pass
+        key = (getattr(font, 'path', id(font)), getattr(font, 'size', None), text)
+        with self._lock:
+            extent = self._extents.get(key)
+            if extent is not None:
+                self._extents.move_to_end(key)
+                return extent
+        left, _, right, _ = font.getbbox(text)
+        with self._lock:
+            self._extents[key] = (left, right)
+            while len(self._extents) > self.max_extents:
+                self._extents.popitem(last=False)
+        return left, right
+
+    def width(self, font, text):
+        left, right = self.extent(font, text)
+        return right - left
+
+    def fit(self, font, text, max_width, min_size=10):
+        """Largest size of font, up to its own, at which text fits in max_width.
+
+        Text width grows almost linearly with the font size, so the size is
+        estimated from one measurement and corrected by at most a few steps,
+        all on glyph tables.
+
+        Args:
+            font: FreeTypeFont loaded from a file
+            text: String to fit
+            max_width: Pixels available to the right of the draw position
+            min_size: Smallest size returned, even if text still overflows
+
+        Returns:
+            font itself if text fits, otherwise a smaller font from the registry
+        """
+        right = self.extent(font, text)[1]
+        if right <= max_width or not isinstance(getattr(font, 'path', None), str):
+            return font
+        size = max(min_size, min(font.size - 1, font.size * max_width // right))
+        fitted = get_font(font.path, size)
+        while size > min_size and self.extent(fitted, text)[1] > max_width:
+            size -= 1
+            fitted = get_font(font.path, size)
+        return fitted
+
+
+_layout = TextLayout()
+
+
+def get_layout():
+    """The shared process-wide TextLayout."""
+    return _layout
@@ -1,41 +1,285 @@
+import json
+import time
+import socket
+import logging
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from src import metrics
+    from src.cache import ResponseCache
+    from src.models import WeatherData
+    from src.retry import RetryPolicy, CircuitBreaker, CircuitOpenError
+    from src.scheduler import CURRENT, HOURLY, DAILY, HOURLY_TTL, DAILY_TTL, PARTS, expires_at
+except ImportError:
+    import metrics
+    from cache import ResponseCache
+    from models import WeatherData
+    from retry import RetryPolicy, CircuitBreaker, CircuitOpenError
+    from scheduler import CURRENT, HOURLY, DAILY, HOURLY_TTL, DAILY_TTL, PARTS, expires_at
+
+logger = logging.getLogger(__name__)
 
 class WeatherService:
-    def __init__(self, lat=40.7128, lon=-74.0060): # Default to New York
+    CURRENT_FIELDS = "temperature_2m,apparent_temperature,relative_humidity_2m,weather_code,wind_speed_10m,wind_direction_10m"
+    HOURLY_FIELDS = "temperature_2m,apparent_temperature,weather_code,wind_speed_10m,wind_direction_10m"
+    DAILY_FIELDS = "weathercode,temperature_2m_max,temperature_2m_min,sunrise,sunset"
+    # Open-Meteo's grid is coarser than 0.01 degrees (~1 km), so nearby
+    # coordinates share cache entries without changing the forecast
+    COORD_PRECISION = 2
+    # Locations per request in get_weather_batch, keeps URLs well under limits
+    MAX_BATCH = 50
+    # Cache TTL per forecast part, None for the cache's own TTL
+    PART_TTL = {HOURLY: HOURLY_TTL, DAILY: DAILY_TTL}
+
+    def __init__(self, lat=40.7128, lon=-74.0060, cache=None, timeout=(3.05, 10),
+                 retry_policy=None, breaker=None): # Default to New York
+        """Initialize the service.
+
+        Args:
+            lat, lon: Default coordinates
+            cache: ResponseCache to use, None for the default on-disk cache
+            timeout: (connect, read) timeouts in seconds for each request
+            retry_policy: RetryPolicy with the per-call deadline, None for the defaults
+            breaker: CircuitBreaker guarding the API, None for the defaults
+        """
         self.lat = lat
         self.lon = lon
         self.base_url = "https://api.open-meteo.com/v1/forecast"
+        self.timeout = timeout
+        self.cache = cache if cache is not None else ResponseCache()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
 
-    def get_current_weather(self, lat=None, lon=None):
+        # One keep-alive connection is reused across cycles instead of a
+        # new TCP+TLS handshake per request
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+
+    def build_params(self, lat, lon, parts=PARTS):
+        """Query parameters for one location.
+
+        Args:
+            lat, lon: Coordinates, rounded to COORD_PRECISION
+            parts: Forecast parts to request, any of CURRENT, HOURLY and DAILY
+        """
         params = {
-            "latitude": lat if lat is not None else self.lat,
-            "longitude": lon if lon is not None else self.lon,
-            "current": "temperature_2m,apparent_temperature,relative_humidity_2m,weather_code,wind_speed_10m,wind_direction_10m",
-            "daily": "weathercode,temperature_2m_max,temperature_2m_min,sunrise,sunset",
-            "timezone": "auto"
+            "latitude": round(lat, self.COORD_PRECISION),
+            "longitude": round(lon, self.COORD_PRECISION),
         }
+        if CURRENT in parts:
+            params["current"] = self.CURRENT_FIELDS
+        if HOURLY in parts:
+            params["hourly"] = self.HOURLY_FIELDS
+        if DAILY in parts:
+            params["daily"] = self.DAILY_FIELDS
+        params["timezone"] = "auto"
+        return params
+
+    def is_fresh(self, entry, parts=PARTS):
+        """Whether a cached response is still the latest data upstream.
+
+        Besides the cache TTL, the current block expires one interval after
+        its own timestamp and the daily block at local midnight, see
+        scheduler.expires_at.
+        """
+        weather = self.from_entry(entry)
+        now = time.time()
+        for part in parts:
+            if not self.cache.is_fresh(entry, self.PART_TTL.get(part)):
+                return False
+            expiry = expires_at(weather, part, entry.fetched_at)
+            if expiry is None or expiry <= now:
+                return False
+        return True
+
+    def from_entry(self, entry):
+        """WeatherData of a cached response, normalized once per entry."""
+        if entry.weather is None:
+            entry.weather = self.normalize(entry.data, entry.fetched_at)
+        return entry.weather
+
+    def cache_key(self, params):
+        fields = {k: v for k, v in params.items() if k not in ("latitude", "longitude")}
+        return self.cache.make_key(params["latitude"], params["longitude"], fields)
+
+    def fetch(self, params):
+        """Request the API and return the decoded JSON body.
+
+        Connection errors, timeouts, 429 and 5xx responses are retried with
+        jittered backoff, and the whole call, retries included, ends within
+        the retry policy's deadline. While the circuit breaker is open no
+        request is made and CircuitOpenError is raised at once, so callers
+        fall back to cached data.
+        """
+        return self.retry_policy.call(lambda deadline: self._fetch_once(params, deadline), self.breaker)
+
+    def _fetch_once(self, params, deadline):
         try:
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Transform to match expected format
-            current_data = data.get("current", {})
-            return {
-                "current": {
-                    "temperature": current_data.get("temperature_2m"),
-                    "apparent_temperature": current_data.get("apparent_temperature"),
-                    "windspeed": current_data.get("wind_speed_10m"),
-                    "winddirection": current_data.get("wind_direction_10m"),
-                    "weathercode": current_data.get("weather_code"),
-                    "is_day": 1 if current_data.get("is_day") else 0,
-                    "time": current_data.get("time")
-                },
-                "daily": data.get("daily")
-            }
+            with metrics.span("http_request"):
+                deadline.check()
+                connect, read = self.timeout
+                remaining = deadline.remaining()
+                with self.session.get(self.base_url, params=params, stream=True,
+                                      timeout=(min(connect, remaining), min(read, remaining))) as response:
+                    response.raise_for_status()
+                    # A server trickling the body never trips the read
+                    # timeout, so the socket is shut down at the deadline
+                    watchdog = threading.Timer(deadline.remaining(), self._abort, (response,))
+                    watchdog.start()
+                    try:
+                        body = response.content
+                    except Exception:
+                        deadline.check()
+                        raise
+                    finally:
+                        watchdog.cancel()
+            with metrics.span("json_decode"):
+                return json.loads(body)
         except Exception as e:
-            print(f"Error fetching weather: {e}")
+            metrics.inc("http_errors", error=type(e).__name__)
+            raise
+
+    @staticmethod
+    def _abort(response):
+        """Unblock a read in progress on the response's connection."""
+        sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def get_current_weather(self, lat=None, lon=None):
+        params = self.build_params(lat if lat is not None else self.lat,
+                                   lon if lon is not None else self.lon)
+        key = self.cache_key(params)
+
+        entry = self.cache.get(key)
+        if entry is not None and self.is_fresh(entry):
+            logger.debug("Weather cache hit")
+            metrics.inc("cache_lookups", result="fresh")
+            return self.from_entry(entry)
+        if entry is not None and self.cache.is_usable_stale(entry):
+            logger.debug("Weather cache stale, revalidating in background")
+            metrics.inc("cache_lookups", result="stale")
+            self._revalidate(key, params)
+            return self.from_entry(entry)
+
+        metrics.inc("cache_lookups", result="miss")
+        try:
+            data = self.fetch(params)
+        except Exception as e:
+            logger.error(f"Error fetching weather: {e}")
+            if entry is not None:
+                logger.warning("Serving expired cached weather")
+                return self.from_entry(entry)
             return None
+        return self.from_entry(self.cache.put(key, data))
+
+    def get_weather_batch(self, locations, parts=PARTS):
+        """Fetch several locations in as few requests as possible.
+
+        Open-Meteo accepts comma-separated coordinate lists and answers with
+        one result per coordinate pair, so every location that is not fresh
+        in the cache is fetched in one request per chunk of MAX_BATCH.
+
+        Args:
+            locations: List of dicts with "lat" and "lon" keys
+            parts: Forecast parts to request, any of CURRENT, HOURLY and
+                DAILY; the others are None in the results
+
+        Returns:
+            List of WeatherData (or None on failure), in the
+            same order as locations
+        """
+        results = [None] * len(locations)
+        pending = []
+        for index, location in enumerate(locations):
+            params = self.build_params(location["lat"], location["lon"], parts)
+            key = self.cache_key(params)
+            entry = self.cache.get(key)
+            if entry is not None and self.is_fresh(entry, parts):
+                metrics.inc("cache_lookups", result="fresh")
+                results[index] = self.from_entry(entry)
+            else:
+                metrics.inc("cache_lookups", result="miss" if entry is None else "stale")
+                pending.append((index, params, key, entry))
+
+        for start in range(0, len(pending), self.MAX_BATCH):
+            chunk = pending[start:start + self.MAX_BATCH]
+            params = dict(chunk[0][1])
+            params["latitude"] = ",".join(str(p["latitude"]) for _, p, _, _ in chunk)
+            params["longitude"] = ",".join(str(p["longitude"]) for _, p, _, _ in chunk)
+            try:
+                data = self.fetch(params)
+                # A single coordinate pair is answered with an object, not a list
+                if isinstance(data, dict):
+                    data = [data]
+                if len(data) != len(chunk):
+                    raise ValueError(f"expected {len(chunk)} results, got {len(data)}")
+            except Exception as e:
+                if isinstance(e, CircuitOpenError):
+                    logger.warning(f"Serving cached weather, {e}")
+                else:
+                    logger.error(f"Error fetching weather batch: {e}")
+                for index, _, _, entry in chunk:
+                    if entry is not None:
+                        results[index] = self.from_entry(entry)
+                continue
+
+            for (index, _, key, _), item in zip(chunk, data):
+                results[index] = self.from_entry(self.cache.put(key, item))
+        return results
+
+    def _revalidate(self, key, params):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.cache.put(key, self.fetch(params))
+            except Exception as e:
+                logger.warning(f"Background weather refresh failed: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="weather-revalidate", daemon=True).start()
+
+    @staticmethod
+    def normalize(data, fetched_at=None):
+        """Parse an API response into a WeatherData, once at ingest.
+
+        is_day is not requested; it is filled in on the device, see
+        playback.view.
+
+        Args:
+            data: Decoded API response for one location
+            fetched_at: Epoch seconds the response was fetched, if known
+        """
+        return WeatherData.from_api(data, fetched_at)
+
+    @staticmethod
+    def merge(previous, update, parts=PARTS):
+        """Combine weather data fetched on separate cadences.
+
+        Args:
+            previous: WeatherData shown so far, or None
+            update: WeatherData holding the freshly fetched parts, or None
+            parts: Parts update was fetched for
+
+        Returns:
+            New WeatherData, previous with those parts replaced where update has them
+        """
+        return (previous or WeatherData()).merge(update, parts)
 
 if __name__ == "__main__":
     ws = WeatherService()
@@ -0,0 +1,286 @@
+import math
+from PIL import Image, ImageDraw
+
+try:
+    from src.icons import IconDrawer
+    from src.models import value_or_none
+    from src.text_layout import get_layout
+except ImportError:
+    from icons import IconDrawer
+    from models import value_or_none
+    from text_layout import get_layout
+
+# Marker for a widget that has not been rendered yet
+_UNRENDERED = object()
+
+# Drawn in place of a value the API did not report
+PLACEHOLDER = "--"
+
+
+def union_box(a, b):
+    """Smallest box containing both boxes; either may be None."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def whole(value):
+    """A value as a whole number for display, PLACEHOLDER if it is None."""
+    return PLACEHOLDER if value is None else int(value)
+
+
+def get_cardinal(d):
+    dirs = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
+    ix = round(d / (360. / len(dirs)))
+    return dirs[ix % len(dirs)]
+
+
+def sparkline_points(times, values, start, span, width, height):
+    """Map samples to pixel points, scaled so their min and max span the height.
+
+    Args:
+        times: Sample times, ascending
+        values: Sample values, NaN where missing
+        start: Time at x = 0
+        span: Time range across the width
+        width, height: Size of the plot in pixels
+
+    Returns:
+        Tuple of (x, y) points, empty if there are fewer than two samples
+    """
+    samples = [(t, v) for t, v in zip(times, values) if not math.isnan(v)]
+    if len(samples) < 2:
+        return ()
+    lo = min(v for _, v in samples)
+    hi = max(v for _, v in samples)
+    x_scale = (width - 1) / span
+    if hi > lo:
+        y_base, y_scale = height - 1, (height - 1) / (hi - lo)
+    else:
+        # A flat line through the middle
+        y_base, y_scale = (height - 1) // 2, 0
+    return tuple((round((t - start) * x_scale), y_base - round((v - lo) * y_scale)) for t, v in samples)
+
+
+class Widget:
+    """A fixed region of the layout with a cached rendered tile.
+
+    Subclasses reduce the weather data to the exact values they display in
+    inputs(), and draw those values in tile coordinates in draw(). The tile
+    is only redrawn when the inputs change.
+    """
+
+    def __init__(self, box):
+        """Initialize the widget.
+
+        Args:
+            box: (left, top, right, bottom) in landscape canvas pixels,
+                right and bottom exclusive
+        """
+        self.box = box
+        self.tile = Image.new('1', (box[2] - box[0], box[3] - box[1]), 255)
+        self.tile_draw = ImageDraw.Draw(self.tile)
+        self.last_inputs = _UNRENDERED
+
+    def inputs(self, weather_data, location_name):
+        """Return a hashable tuple of everything the widget displays."""
+        raise NotImplementedError
+
+    def draw(self, draw, inputs):
+        """Draw the inputs onto the blank tile."""
+        raise NotImplementedError
+
+    def update(self, weather_data, location_name):
+        """Redraw the tile if the inputs changed.
+
+        Returns:
+            True if the tile was redrawn
+        """
+        inputs = self.inputs(weather_data, location_name)
+        if inputs == self.last_inputs:
+            return False
+        self.tile.paste(255, (0, 0) + self.tile.size)
+        self.draw(self.tile_draw, inputs)
+        self.last_inputs = inputs
+        return True
+
+    def invalidate(self):
+        self.last_inputs = _UNRENDERED
+
+
+class CurrentIconWidget(Widget):
+    def __init__(self, box, icon_font_path, icon_size, atlas=None):
+        super().__init__(box)
+        self.icon_size = icon_size
+        self.icon_drawer = IconDrawer(self.tile_draw, icon_font_path, icon_size, atlas=atlas)
+
+    def inputs(self, weather_data, location_name):
+        current = weather_data.current
+        return (current.weathercode, current.is_day)
+
+    def draw(self, draw, inputs):
+        code, is_day = inputs
+        self.icon_drawer.draw_icon_for_code(code, 5 - self.box[0], 5 - self.box[1], self.icon_size, is_day)
+
+
+class TemperatureWidget(Widget):
+    def __init__(self, box, font):
+        super().__init__(box)
+        self.font = font
+        self.text_layout = get_layout()
+
+    def inputs(self, weather_data, location_name):
+        return (weather_data.current.temperature,)
+
+    def draw(self, draw, inputs):
+        temp_c, = inputs
+        if temp_c is None:
+            temp_text = f"{PLACEHOLDER}°C / {PLACEHOLDER}°F"
+        else:
+            temp_f = (temp_c * 9/5) + 32
+            temp_text = f"{temp_c}°C / {int(temp_f)}°F"
+        x = 65 - self.box[0]
+        font = self.text_layout.fit(self.font, temp_text, self.tile.size[0] - x)
+        draw.text((x, 10 - self.box[1]), temp_text, font=font, fill=0)
+
+
+class WindWidget(Widget):
+    def __init__(self, box, font):
+        super().__init__(box)
+        self.font = font
+        self.text_layout = get_layout()
+
+    def inputs(self, weather_data, location_name):
+        current = weather_data.current
+        wind_kmh = current.windspeed
+        wind_cardinal = get_cardinal(current.winddirection or 0)
+        if wind_kmh is None:
+            return (PLACEHOLDER, PLACEHOLDER, wind_cardinal)
+        wind_mph = wind_kmh * 0.621371  # Convert km/h to mph
+        return (wind_kmh, int(wind_mph), wind_cardinal)
+
+    def draw(self, draw, inputs):
+        wind_kmh, wind_mph, wind_cardinal = inputs
+        text = f"W: {wind_kmh} km/h ({wind_mph} mph) {wind_cardinal}"
+        x = 65 - self.box[0]
+        # Shrunk to the box width; a smaller font stays vertically centered
+        font = self.text_layout.fit(self.font, text, self.tile.size[0] - x)
+        y = 40 - self.box[1]
+        if font is not self.font:
+            y += (self.font.size - font.size) // 2
+        draw.text((x, y), text, font=font, fill=0)
+
+
+class SparklineWidget(Widget):
+    """Observed temperature trend of the shown location, read from a HistoryStore."""
+
+    MARGIN = 3
+
+    def __init__(self, box, history, hours=24):
+        super().__init__(box)
+        self.history = history
+        self.span = hours * 3600
+
+    def inputs(self, weather_data, location_name):
+        end = weather_data.current.time
+        if end is None:
+            return ()
+        window = self.history.window(location_name, end - self.span)
+        width, height = self.tile.size
+        return sparkline_points(window.times, window.temperature, end - self.span, self.span,
+                                width - 2 * self.MARGIN, height - 2 * self.MARGIN)
+
+    def draw(self, draw, inputs):
+        if not inputs:
+            return
+        draw.line([(x + self.MARGIN, y + self.MARGIN) for x, y in inputs], fill=0, width=1)
+
+
+class DividerWidget(Widget):
+    def inputs(self, weather_data, location_name):
+        return ()
+
+    def draw(self, draw, inputs):
+        # Divider between top and bottom
+        draw.line((0, 65 - self.box[1], self.box[2], 65 - self.box[1]), fill=0, width=2)
+
+
+class ForecastDayWidget(Widget):
+    """One forecast column: day name, icon and max/min temperature."""
+
+    # Pixels between the icon and the temperature range, and kept clear at
+    # either side of the column
+    GAP = 4
+    PADDING = 4
+
+    def __init__(self, box, day_index, font, icon_font_path, icon_size, atlas=None):
+        super().__init__(box)
+        self.day_index = day_index
+        self.font = font
+        self.text_layout = get_layout()
+        self.icon_size = icon_size
+        self.icon_drawer = IconDrawer(self.tile_draw, icon_font_path, icon_size, atlas=atlas)
+
+    def inputs(self, weather_data, location_name):
+        daily = weather_data.daily
+        i = self.day_index
+        if daily is None or i >= len(daily):
+            return None
+        # Date -> Day name
+        day_name = daily.dates[i].strftime('%a') # Mon, Tue...
+        return (day_name, value_or_none(daily.weathercode[i]),
+                whole(value_or_none(daily.temperature_max[i])),
+                whole(value_or_none(daily.temperature_min[i])))
+
+    def draw(self, draw, inputs):
+        if inputs is None:
+            return
+        day_name, code, t_max, t_min = inputs
+        col_width = self.tile.size[0]
+
+        # Center text in column
+        w = self.text_layout.width(self.font, day_name)
+        draw.text(((col_width - w)//2, 68 - self.box[1]), day_name, font=self.font, fill=0)
+
+        # Icon and Temp Range (Max/Min), e.g. 20/15, side by side below the
+        # day name, shrunk to fit and centered together in the column
+        temp_range = f"{t_max}/{t_min}"
+        font = self.text_layout.fit(self.font, temp_range, col_width - 2 * self.PADDING - self.icon_size - self.GAP)
+        w = self.icon_size + self.GAP + self.text_layout.width(font, temp_range)
+        x = (col_width - w)//2
+        y = 95 - self.box[1]
+        # Forecast icons are always drawn in day style
+        self.icon_drawer.draw_icon_for_code(code, x, y, self.icon_size, is_day=1)
+        draw.text((x + self.icon_size + self.GAP, y + self.icon_size//2), temp_range,
+                  font=font, fill=0, anchor='lm')
+
+
+class WidgetLayout:
+    """Composites widget tiles onto a persistent canvas.
+
+    The canvas keeps the previous frame, so only tiles whose inputs changed
+    are redrawn and pasted, and the union of their boxes is the damage.
+    """
+
+    def __init__(self, widgets):
+        self.widgets = widgets
+
+    def render(self, canvas, weather_data, location_name):
+        """Bring the canvas up to date with the weather data.
+
+        Returns:
+            Damaged (left, top, right, bottom) box, or None if nothing changed
+        """
+        damage = None
+        for widget in self.widgets:
+            if widget.update(weather_data, location_name):
+                canvas.paste(widget.tile, widget.box[:2])
+                damage = union_box(damage, widget.box)
+        return damage
+
+    def invalidate(self):
+        """Force every widget to redraw on the next render."""
+        for widget in self.widgets:
+            widget.invalidate()
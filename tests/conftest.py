@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'lib'))
+
+# The driver runs against the emulated SSD1680, never real GPIO/SPI
+os.environ['EPD_BACKEND'] = 'simulator'
+os.environ.pop('EPD_SIM_DIR', None)
+
+from waveshare_epd import epd2in13_V4, epdconfig  # noqa: E402
+from waveshare_epd.simulator import SSD1680  # noqa: E402
+
+LINEWIDTH = (epd2in13_V4.EPD_WIDTH + 7) // 8
+
+
+@pytest.fixture
+def controller():
+    """Emulated controller of a freshly powered panel."""
+    backend = epdconfig.get_implementation()
+    backend.controller = SSD1680()
+    backend.reset_stats()
+    backend.clock_ms = backend.busy_until_ms = 0.0
+    return backend.controller
+
+
+@pytest.fixture
+def make_frame():
+    """Factory of packed white frames with some rows filled with a byte value."""
+    def make_frame(rows=(), value=0x00):
+        buffer = bytearray(b'\xff' * (LINEWIDTH * epd2in13_V4.EPD_HEIGHT))
+        for y in rows:
+            buffer[y * LINEWIDTH:(y + 1) * LINEWIDTH] = bytes((value,)) * LINEWIDTH
+        return buffer
+    return make_frame
@@ -0,0 +1,95 @@
+import pytest
+
+from src.display_service import DisplayService
+from src.refresh_policy import RefreshMode, RefreshPolicy
+from src.snapshot import PanelState, Snapshot
+
+
+def show(service, image):
+    """Refresh the panel with a copy of image in a pool buffer."""
+    buffer = service.frame_pool.acquire()
+    buffer[:] = image
+    return service.refresh(buffer)
+
+
+@pytest.fixture
+def state_dir(tmp_path):
+    return str(tmp_path)
+
+
+@pytest.fixture
+def service(controller, state_dir):
+    return DisplayService(refresh_policy=RefreshPolicy(max_partials=2, max_fast=1),
+                          snapshot=Snapshot(state_dir))
+
+
+def test_startup_without_snapshot_clears_the_panel(service, controller):
+    assert controller.updates == ['full']
+    assert service.last_buffer is None
+
+
+def test_small_changes_escalate_to_full_after_max_partials(service, controller, make_frame):
+    modes = [show(service, make_frame(rows=range(row))) for row in range(1, 6)]
+
+    assert modes == [RefreshMode.FULL, RefreshMode.PARTIAL, RefreshMode.PARTIAL,
+                     RefreshMode.FULL, RefreshMode.PARTIAL]
+    assert controller.updates[1:] == ['full', 'partial', 'partial', 'full', 'partial']
+    assert controller.panel == make_frame(rows=range(5))
+
+
+def test_large_changes_use_fast_then_full(service, controller, make_frame):
+    half = range(125)
+    modes = [show(service, make_frame()),
+             show(service, make_frame(rows=half)),
+             show(service, make_frame()),
+             show(service, make_frame(rows=half))]
+
+    assert modes == [RefreshMode.FULL, RefreshMode.FAST, RefreshMode.FULL, RefreshMode.FAST]
+    assert controller.panel == make_frame(rows=half)
+
+
+def test_unchanged_frame_is_skipped(service, controller, make_frame):
+    show(service, make_frame(rows=[3]))
+    updates = list(controller.updates)
+
+    assert show(service, make_frame(rows=[3])) == RefreshMode.SKIP
+    assert controller.updates == updates
+
+
+def test_shown_buffer_stays_reserved(service, make_frame):
+    show(service, make_frame(rows=[3]))
+    shown = service.last_buffer
+    pool = service.frame_pool
+
+    ahead = [pool.acquire() for _ in range(len(pool.buffers) - 1)]
+    assert all(buffer is not shown for buffer in ahead)
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+
+def test_restart_restores_the_shown_frame_without_a_clear(service, controller, state_dir, make_frame):
+    image = make_frame(rows=[40, 41])
+    show(service, image)
+    updates = list(controller.updates)
+
+    restarted = DisplayService(refresh_policy=RefreshPolicy(), snapshot=Snapshot(state_dir))
+
+    # Loaded into RAM as the partial-refresh base, no refresh at all
+    assert controller.updates == updates
+    assert restarted.last_buffer == image
+    assert show(restarted, make_frame(rows=[40, 41, 42])) == RefreshMode.PARTIAL
+    assert controller.panel == make_frame(rows=[40, 41, 42])
+
+
+def test_restart_after_clear_shows_the_saved_frame(service, controller, state_dir, make_frame):
+    image = make_frame(rows=[40, 41])
+    show(service, image)
+    service.clear()
+    assert Snapshot(state_dir).load_frame(122, 250).state == PanelState.CLEARED
+    updates = len(controller.updates)
+
+    DisplayService(refresh_policy=RefreshPolicy(), snapshot=Snapshot(state_dir))
+
+    # One full refresh of the saved frame in place of the clear
+    assert controller.updates[updates:] == ['full']
+    assert controller.panel == image
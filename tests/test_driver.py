@@ -0,0 +1,93 @@
+import pytest
+
+from waveshare_epd import epd2in13_V4, epdconfig
+from waveshare_epd.simulator import RAM_X_BYTES
+
+
+@pytest.fixture
+def epd(controller):
+    epd = epd2in13_V4.EPD()
+    epd.init()
+    return epd
+
+
+def ram_bytes_written(trace):
+    """Data bytes sent to WRITE_RAM (0x24) in a simulator SPI trace."""
+    written = 0
+    command = None
+    for _, dc, data in trace:
+        if dc == 0:
+            command = data[-1]
+        elif command == 0x24:
+            written += len(data)
+    return written
+
+
+def test_full_refresh_shows_the_frame(epd, controller, make_frame):
+    image = make_frame(rows=range(0, 250, 7))
+
+    epd.displayPartBaseImage(image)
+
+    assert controller.updates == ['full']
+    assert controller.panel == image
+
+
+def test_partial_window_uploads_only_the_changed_bands(epd, controller, make_frame):
+    base = make_frame()
+    epd.displayPartBaseImage(base)
+    changed = make_frame(rows=[10, 11, 12, 200])
+    # One byte in the middle of a row, to check the band's x range
+    changed[100 * epd.linewidth() + 5] = 0x0F
+    backend = epdconfig.get_implementation()
+    backend.reset_stats()
+
+    bands = epd.displayPartialWindow(changed, base)
+
+    last = epd.linewidth() - 1
+    assert bands == [(0, 10, last, 12), (5, 100, 5, 100), (0, 200, last, 200)]
+    assert controller.updates[-1] == 'partial'
+    assert controller.panel == changed
+    linewidth = epd.linewidth()
+    assert ram_bytes_written(backend.spi_trace) == 3 * linewidth + 1 + linewidth
+    # Display mode 2 keeps the new frame as the reference for the next one
+    row = 10 * RAM_X_BYTES
+    assert controller.ram[0x26][row:row + linewidth] == changed[10 * linewidth:11 * linewidth]
+
+
+def test_consecutive_partial_windows_track_the_glass(epd, controller, make_frame):
+    frames = [make_frame(), make_frame(rows=[50]), make_frame(rows=[50, 51]), make_frame(rows=[249])]
+    epd.displayPartBaseImage(frames[0])
+    for previous, image in zip(frames, frames[1:]):
+        epd.displayPartialWindow(image, previous)
+        assert controller.panel == image
+    assert controller.updates == ['full', 'partial', 'partial', 'partial']
+
+
+def test_partial_window_with_rows_hint_limits_the_comparison(epd, controller, make_frame):
+    base = make_frame()
+    epd.displayPartBaseImage(base)
+    changed = make_frame(rows=[30, 120])
+
+    bands = epd.displayPartialWindow(changed, base, rows=(100, 130))
+
+    assert [band[1] for band in bands] == [120]
+
+
+def test_partial_window_falls_back_when_the_hint_misses_the_change(epd, controller, make_frame):
+    base = make_frame()
+    epd.displayPartBaseImage(base)
+    changed = make_frame(rows=range(100, 104))
+
+    bands = epd.displayPartialWindow(changed, base, rows=(0, 10))
+
+    assert bands == [(0, 100, epd.linewidth() - 1, 103)]
+    assert controller.updates[-1] == 'partial'
+    assert controller.panel == changed
+
+
+def test_unchanged_frame_is_not_refreshed(epd, controller, make_frame):
+    base = make_frame(rows=[5])
+    epd.displayPartBaseImage(base)
+
+    assert epd.displayPartialWindow(bytearray(base), base) == []
+    assert controller.updates == ['full']
@@ -0,0 +1,68 @@
+import math
+import os
+
+from src.history import HISTORY_HEADER, HISTORY_RECORD, HistoryRing, HistoryStore
+from src.models import CurrentConditions
+
+T0 = 1800000000
+STEP = 900
+
+
+def reading(index, temperature=None):
+    return CurrentConditions(temperature=float(index) if temperature is None else temperature,
+                             apparent_temperature=None, windspeed=5.0, winddirection=90,
+                             weathercode=1, is_day=1, time=T0 + index * STEP, interval=STEP)
+
+
+def test_ring_wraps_around_and_keeps_the_newest_records(tmp_path):
+    ring = HistoryRing(str(tmp_path / 'ring.bin'), capacity=5)
+    for i in range(12):
+        assert ring.append(T0 + i * STEP, float(i), 1.0, 3)
+
+    window = ring.window(0)
+    assert list(window.times) == [T0 + i * STEP for i in range(7, 12)]
+    assert list(window.temperature) == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert os.path.getsize(str(tmp_path / 'ring.bin')) == HISTORY_HEADER.size + 5 * HISTORY_RECORD.size
+
+
+def test_window_across_the_wrap_point(tmp_path):
+    ring = HistoryRing(str(tmp_path / 'ring.bin'), capacity=5)
+    for i in range(8):
+        ring.append(T0 + i * STEP, float(i), 1.0, 3)
+
+    # Records 5..7 sit at slots 0..2, record 4 at slot 4
+    assert list(ring.window(T0 + 4 * STEP).temperature) == [4.0, 5.0, 6.0, 7.0]
+    assert list(ring.window(T0 + 6 * STEP).temperature) == [6.0, 7.0]
+    assert len(ring.window(T0 + 8 * STEP)) == 0
+
+
+def test_ring_rejects_records_that_are_not_newer(tmp_path):
+    ring = HistoryRing(str(tmp_path / 'ring.bin'), capacity=5)
+    assert ring.append(T0, 1.0, 1.0, 3)
+    assert not ring.append(T0, 2.0, 1.0, 3)
+    assert not ring.append(T0 - STEP, 2.0, 1.0, 3)
+    assert list(ring.window(0).temperature) == [1.0]
+
+
+def test_store_survives_a_restart_and_stores_missing_values(tmp_path):
+    store = HistoryStore(str(tmp_path), capacity=4)
+    for i in range(6):
+        store.append('Oslo, NO', reading(i))
+    store.append('Oslo, NO', reading(6).replace(temperature=None, weathercode=None))
+    store.close()
+
+    reopened = HistoryStore(str(tmp_path), capacity=4)
+    window = reopened.window('Oslo, NO', 0)
+    assert list(window.times) == [T0 + i * STEP for i in range(3, 7)]
+    assert list(window.temperature)[:3] == [3.0, 4.0, 5.0]
+    assert math.isnan(window.temperature[3])
+    assert os.listdir(str(tmp_path)) == ['history-oslo-no.bin']
+    reopened.close()
+
+
+def test_store_resets_a_ring_of_another_capacity(tmp_path):
+    store = HistoryStore(str(tmp_path), capacity=4)
+    store.append('Oslo', reading(0))
+    store.close()
+
+    assert len(HistoryStore(str(tmp_path), capacity=8).window('Oslo', 0)) == 0
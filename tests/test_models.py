@@ -0,0 +1,59 @@
+import math
+from array import array
+from datetime import date
+
+from src.models import (MISSING_CODE, CurrentConditions, DailySeries, HourlySeries,
+                        WeatherData, value_or_none)
+
+
+def make_daily(temperature_max=(21.5, math.nan, 19.0)):
+    n = len(temperature_max)
+    return DailySeries(tuple(date(2024, 6, 1 + i) for i in range(n)),
+                       array('h', [3, MISSING_CODE, 61][:n]),
+                       array('f', temperature_max), array('f', [12.0] * n),
+                       array('d', [math.nan] * n), array('d', [math.nan] * n))
+
+
+def make_hourly(temperature=(20.0, math.nan, 18.5)):
+    n = len(temperature)
+    return HourlySeries(1717200000, 3600, array('f', temperature), array('f', [19.0] * n),
+                        array('f', [10.0] * n), array('f', [math.nan] * n), array('h', [1] * n))
+
+
+def make_weather(daily=None, hourly=None):
+    current = CurrentConditions(temperature=20.0, apparent_temperature=None, windspeed=None,
+                                winddirection=None, weathercode=3, is_day=1,
+                                time=1717200000, interval=900)
+    return WeatherData(current=current, hourly=hourly or make_hourly(), daily=daily or make_daily())
+
+
+def test_daily_series_with_missing_values_equals_itself_and_a_copy():
+    a = make_daily()
+    b = make_daily()
+    assert a == a
+    assert a == b
+    assert a.version == b.version
+
+
+def test_hourly_series_with_missing_values_equals_a_copy():
+    assert make_hourly() == make_hourly()
+
+
+def test_series_differing_in_one_value_are_unequal():
+    assert make_daily() != make_daily((21.5, 20.0, 19.0))
+    assert make_hourly() != make_hourly((20.0, 17.0, 18.5))
+
+
+def test_weather_with_gaps_equals_its_round_trip():
+    weather = make_weather()
+    restored = WeatherData.from_dict(weather.to_dict())
+    assert weather == weather
+    assert restored == weather
+    assert restored.version == weather.version
+
+
+def test_value_or_none():
+    daily = make_daily()
+    assert value_or_none(daily.temperature_max[1]) is None
+    assert value_or_none(daily.weathercode[1]) is None
+    assert value_or_none(daily.weathercode[0]) == 3
@@ -0,0 +1,138 @@
+import pytest
+import requests
+
+from src import retry
+from src.retry import CircuitBreaker, CircuitOpenError, RetryPolicy, is_retryable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry.time, 'monotonic', clock)
+    monkeypatch.setattr(retry.time, 'sleep', lambda seconds: setattr(clock, 'now', clock.now + seconds))
+    return clock
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def test_is_retryable():
+    assert is_retryable(requests.ConnectionError())
+    assert is_retryable(requests.Timeout())
+    assert is_retryable(http_error(503))
+    assert is_retryable(http_error(429))
+    assert not is_retryable(http_error(404))
+    assert not is_retryable(ValueError("bad body"))
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_breaker_lets_one_trial_call_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    clock.now += 59
+    assert not breaker.allow()
+
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    clock.now += 60
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 59
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_policy_retries_transient_errors(clock):
+    errors = [requests.ConnectionError(), http_error(503)]
+
+    def operation(deadline):
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    breaker = CircuitBreaker(failure_threshold=5)
+    assert RetryPolicy(attempts=3, deadline=30).call(operation, breaker) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_policy_does_not_retry_client_errors(clock):
+    calls = []
+
+    def operation(deadline):
+        calls.append(deadline)
+        raise http_error(404)
+
+    with pytest.raises(requests.HTTPError):
+        RetryPolicy(attempts=3).call(operation)
+    assert len(calls) == 1
+
+
+def test_policy_gives_up_when_no_retry_fits_the_deadline(clock):
+    calls = []
+
+    def operation(deadline):
+        calls.append(deadline)
+        raise requests.ConnectionError()
+
+    with pytest.raises(requests.ConnectionError):
+        RetryPolicy(attempts=5, backoff_base=4, deadline=5).call(operation)
+    assert len(calls) == 2
+
+
+def test_open_breaker_refuses_calls_without_trying(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    calls = []
+
+    def operation(deadline):
+        calls.append(deadline)
+        raise requests.ConnectionError()
+
+    with pytest.raises(requests.ConnectionError):
+        RetryPolicy(attempts=2, backoff_base=0.1, deadline=30).call(operation, breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        RetryPolicy(attempts=2).call(operation, breaker)
+    assert len(calls) == 2